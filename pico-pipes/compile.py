@@ -1,18 +1,70 @@
-import pretty_midi
+import argparse
+import concurrent.futures
+import glob
+import hashlib
+import json
+import os
 import sys
 import time
 import csv
 
+import numpy as np
+
+from modules import analyze
+from modules import boards
+from modules import bundle
+from modules import cache
+from modules import catalog
+from modules import emitters as emitters_lib
+from modules import fit as fit_lib
+from modules import header
+from modules import normalize
+from modules import phrases
+from modules import scheduler
+from modules import simulate
+from modules import ticks
+from modules import smf
+from modules import timeline as timeline_lib
+from modules import tuning
+from modules import uf2
+from modules import varint
+from modules import voices
+
+# Output file name stem, written to the CWD by default
+OUTPUT_STEM = 'notes'
 # Output track file for pico
-OUTPUT_NAME_PICO = './notes.h'
+OUTPUT_SUFFIX_PICO = '.h'
+# Raw packed note table, same layout as the packed Pico header
+OUTPUT_SUFFIX_BIN = '.bin'
+# Varint note stream for memory-limited targets, as a C header and raw blob
+OUTPUT_SUFFIX_VARINT = '-varint.h'
+OUTPUT_SUFFIX_VARINT_BIN = '-varint.bin'
 # Output track file for Thumby
-OUTPUT_NAME_THUMBY = './notes.py'
+OUTPUT_SUFFIX_THUMBY = '.py'
+# Packed notes for Thumby and the module that reads them, without a note limit
+OUTPUT_SUFFIX_THUMBY_BIN = '-thumby.bin'
+OUTPUT_SUFFIX_THUMBY_READER = '-thumby.py'
 # Output track file for pebble-dev/watchapps/midi-player
-OUTPUT_NAME_PEBBLE = './notes-pebble.h'
+OUTPUT_SUFFIX_PEBBLE = '-pebble.h'
+# Phrase table of repeated runs of notes, for memory-limited targets
+OUTPUT_SUFFIX_PHRASES = '-phrases.bin'
+# Output track file for other tools
+OUTPUT_SUFFIX_JSON = '.json'
+# Note table in the Pico's flash, to flash without rebuilding the firmware
+OUTPUT_SUFFIX_UF2 = '.uf2'
+# Default batch manifest of track selections, inside the MIDI directory
+MANIFEST_NAME = 'manifest.json'
+# MIDI file extensions picked up by batch mode
+MIDI_EXTENSIONS = ['.mid', '.midi']
 # Recommended max notes for Thumby memory (+comilation memory required)
 THUMBY_MAX = 800
 # Avoid 'app too large' at 65k warning
 PEBBLE_MAX = 2000
+# MIDI file readers - the built-in one gives the same note times as pretty_midi
+# without its import and parsing cost
+READERS = ['builtin', 'pretty_midi']
+# How often watch mode checks the MIDI file for a save
+WATCH_INTERVAL_MS = 20
 # Map of program indexes to names
 PROGRAM_MAP = {
   1: 'Acoustic Grand Piano',
@@ -145,141 +197,924 @@ PROGRAM_MAP = {
   128: 'Gunshot'
 }
 
-file_name = sys.argv[1]
-print(f"file_name: {file_name}")
-
-data = {
-  'instruments': [],
-  'timeline': []
-}
+# Instruments of a MIDI file, read by the built-in reader or pretty_midi
+def read_midi(path, reader='builtin'):
+  if reader == 'builtin':
+    return smf.read_instruments(path)
 
-# Add a new event to the timeline
-def add_event(track, pitch, on_at, off_at):
-  data['timeline'].append({
-    'track': track,
-    'pitch': pitch,
-    'on_at': on_at,
-    'off_at': off_at
-  })
+  # Imported here so only runs that ask for it pay for it
+  import pretty_midi
+  return pretty_midi.PrettyMIDI(path).instruments
 
-# The main function
-def main():
-  # Load midi file
-  midi_data = pretty_midi.PrettyMIDI(file_name)
-  print()
-  
-  # Read instruments - skip the drums
+# Load a MIDI file and list its playable instruments - skips the drums
+def load_instruments(path, reader='builtin'):
   non_drum_instruments = []
-  for i, instrument in enumerate(midi_data.instruments):
+  for i, instrument in enumerate(read_midi(path, reader)):
     if not instrument.is_drum:
       program_name = PROGRAM_MAP[instrument.program] if instrument.program > 0 else 'Unknown'
       num_notes = len(instrument.notes)
-      selected = {
+      non_drum_instruments.append({
         'pm_instrument': instrument,
         'program_name': program_name,
         'num_notes': num_notes,
         'summary': f"Track {i} ({program_name}): {num_notes} notes"
-      }
-      non_drum_instruments.append(selected)
+      })
+  return non_drum_instruments
 
-  for i, instrument in enumerate(non_drum_instruments):
-    print(f"{i}: {instrument['summary']}")
+# Catalog metadata of each playable track of a MIDI file, indexed as on the
+# command line
+def describe_midi(path, reader='builtin'):
+  tracks = []
+  for i, instrument in enumerate(load_instruments(path, reader)):
+    notes = instrument['pm_instrument'].notes
+    on = np.array([note.start for note in notes], dtype=np.float64)
+    off = np.array([note.end for note in notes], dtype=np.float64)
+    pitches = [note.pitch for note in notes]
+    tracks.append({
+      'track': i,
+      'summary': instrument['summary'],
+      'program': instrument['pm_instrument'].program,
+      'program_name': instrument['program_name'],
+      'notes': instrument['num_notes'],
+      'pitch_min': min(pitches) if pitches else None,
+      'pitch_max': max(pitches) if pitches else None,
+      'duration': float(off.max()) if len(off) else 0.0,
+      'max_polyphony': analyze.max_polyphony(on, off),
+    })
+  return tracks
+
+# Build a NoteTimeline of the chosen instruments, in the order given. With
+# lazy, notes are merged by on time as they are written instead.
+def build_timeline(instruments, tracks, file_name='', lazy=False):
+  selected = [instruments[int(track)] for track in tracks]
+  build = timeline_lib.MergedTimeline if lazy else timeline_lib.from_note_lists
+  return build(
+    [instrument['pm_instrument'].notes for instrument in selected],
+    file_name,
+    [instrument['summary'] for instrument in selected]
+  )
+
+# Compile a MIDI file into a NoteTimeline of the chosen track indexes
+def compile_midi(path, tracks, reader='builtin', lazy=False):
+  return build_timeline(load_instruments(path, reader), tracks, path, lazy)
+
+# Pico header in the format chosen by the table options
+def make_pico_emitter(path, limit, options):
+  if options['step_delays'] is not None:
+    return emitters_lib.TimedPicoEmitter(path, options['step_delays'], limit)
+  if options['packed']:
+    return emitters_lib.PackedPicoEmitter(path, limit)
+  return emitters_lib.PicoEmitter(path, limit)
+
+# Raw blob of the packed or timed Pico header - float headers have none
+def make_bin_emitter(path, limit, options):
+  if options['step_delays'] is not None:
+    return emitters_lib.TimedBinEmitter(path, options['step_delays'], limit)
+  if options['packed']:
+    return emitters_lib.PackedBinEmitter(path, limit)
+  return None
+
+# Output targets that can be chosen with --targets. Other tools can add their
+# own before calling write_outputs().
+TARGETS = {
+  'pico': emitters_lib.Target(OUTPUT_SUFFIX_PICO, make_pico_emitter, description='Pico C header'),
+  'bin': emitters_lib.Target(OUTPUT_SUFFIX_BIN, make_bin_emitter, description='Raw blob of the packed or timed Pico header'),
+  'thumby': emitters_lib.Target(
+    OUTPUT_SUFFIX_THUMBY,
+    lambda path, limit, options: emitters_lib.ThumbyEmitter(path, options['file_name'], limit),
+    THUMBY_MAX,
+    'Python module for Thumby'
+  ),
+  'thumby-bin': emitters_lib.Target(
+    OUTPUT_SUFFIX_THUMBY_BIN,
+    lambda path, limit, options: emitters_lib.ThumbyBinEmitter(
+      path,
+      path[:-len(OUTPUT_SUFFIX_THUMBY_BIN)] + OUTPUT_SUFFIX_THUMBY_READER,
+      options['file_name'],
+      limit
+    ),
+    description='Packed notes for Thumby and a module that reads them'
+  ),
+  'pebble': emitters_lib.Target(
+    OUTPUT_SUFFIX_PEBBLE,
+    lambda path, limit, options: emitters_lib.PebbleEmitter(path, limit),
+    PEBBLE_MAX,
+    'C header for Pebble'
+  ),
+  'varint': emitters_lib.Target(
+    OUTPUT_SUFFIX_VARINT,
+    lambda path, limit, options: emitters_lib.VarintHeaderEmitter(path, limit),
+    description='C header of a varint note stream'
+  ),
+  'varint-bin': emitters_lib.Target(
+    OUTPUT_SUFFIX_VARINT_BIN,
+    lambda path, limit, options: emitters_lib.VarintBinEmitter(path, limit),
+    description='Raw varint note stream'
+  ),
+  'uf2': emitters_lib.Target(
+    OUTPUT_SUFFIX_UF2,
+    lambda path, limit, options: emitters_lib.Uf2Emitter(path, options['step_delays'], options['firmware'], limit),
+    description='UF2 of the note table for firmware built with NOTE_TABLE_FLASH'
+  ),
+  'phrases': emitters_lib.Target(
+    OUTPUT_SUFFIX_PHRASES,
+    lambda path, limit, options: emitters_lib.PhraseEmitter(path, limit),
+    description='Phrase table storing repeated sections once'
+  ),
+  'json': emitters_lib.Target(
+    OUTPUT_SUFFIX_JSON,
+    lambda path, limit, options: emitters_lib.JsonEmitter(path, options['file_name'], limit),
+    description='JSON list of notes'
+  ),
+}
+# Targets written when none are chosen, plus the varint ones with --varint
+DEFAULT_TARGETS = ['pico', 'bin', 'thumby', 'pebble']
+
+# Names of the targets chosen with --targets and --varint, or None for the defaults
+def get_targets(args):
+  if not args.targets:
+    return None
+  names = args.targets.split(',')
+  unknown = [name for name in names if name not in TARGETS]
+  if unknown:
+    raise SystemExit(f"Unknown targets {', '.join(unknown)}, choose from {', '.join(TARGETS)}")
+  if args.varint:
+    names += [name for name in ['varint', 'varint-bin'] if name not in names]
+  return names
+
+# Emitters for each output file of a song. Default targets that the table
+# options don't call for (like 'bin' for float headers) are left out, but
+# choosing one of those is an error. A firmware to patch implies 'uf2'.
+def make_emitters(file_name, use_packed=False, out_dir='.', stem=OUTPUT_STEM, use_varint=False, step_delays=None, targets=None, firmware=None):
+  chosen = targets is not None
+  if not chosen:
+    targets = DEFAULT_TARGETS + (['varint', 'varint-bin'] if use_varint else [])
+  if firmware is not None and 'uf2' not in targets:
+    targets = targets + ['uf2']
+  options = {
+    'file_name': file_name,
+    'packed': use_packed,
+    'step_delays': step_delays,
+    'firmware': firmware,
+  }
+
+  base = os.path.join(out_dir, stem)
+  emitters = []
+  for name in targets:
+    target = TARGETS[name]
+    emitter = target.make(base + target.suffix, target.limit, options)
+    if emitter is not None:
+      emitters.append(emitter)
+    elif chosen:
+      raise SystemExit(f"Target {name} does not apply to these table options")
+  return emitters
+
+# Write a timeline to the output files of some targets (default: all the
+# options call for). With fit, outputs with a note limit are fitted into it
+# rather than cut short, and with max_bytes every output is fitted into that
+# many bytes. With more than one thread, targets are written concurrently.
+def write_outputs(timeline, use_packed=False, out_dir='.', stem=OUTPUT_STEM, verbose=True, use_varint=False, step_delays=None, fit=False, max_bytes=None, targets=None, threads=1, firmware=None):
+  emitters = prepare_outputs(timeline, use_packed, out_dir, stem, verbose, use_varint, step_delays, fit, max_bytes, targets, threads, firmware)
+  emitters_lib.commit(emitters, verbose)
+
+# Write a timeline's outputs as write_outputs() does, but only to their temp
+# files, and check them. Returns the emitters for emitters_lib.commit() to put
+# in place, so callers writing several can replace all or none of them.
+def prepare_outputs(timeline, use_packed=False, out_dir='.', stem=OUTPUT_STEM, verbose=True, use_varint=False, step_delays=None, fit=False, max_bytes=None, targets=None, threads=1, firmware=None):
+  emitters = make_emitters(timeline.file_name, use_packed, out_dir, stem, use_varint, step_delays, targets, firmware)
+
+  # Varint streams keep the track in a nibble, and a note table too big for the
+  # flash region is known before writing anything, unless --max-bytes is going
+  # to fit it
+  for emitter in emitters:
+    if emitter.kind == 'varint' and timeline.num_tracks() > varint.MAX_TRACKS:
+      raise SystemExit(
+        f"{emitter.path} holds tracks 0 to {varint.MAX_TRACKS - 1} but the song plays track {timeline.num_tracks() - 1}, "
+        f"choose fewer tracks or allocate notes to at most {varint.MAX_TRACKS} with --motors"
+      )
+    if isinstance(emitter, emitters_lib.Uf2Emitter) and max_bytes is None:
+      size = uf2.REGION_HEADER.size + fit_lib.table_size(timeline, emitter.kind)
+      if size > uf2.REGION_SIZE:
+        raise SystemExit(f"Note table is {size} bytes, the flash region holds {uf2.REGION_SIZE}, fit it with --max-bytes {uf2.REGION_SIZE - uf2.REGION_HEADER.size}")
+
+  try:
+    written = {}
+    if fit or max_bytes is not None:
+      written = fit_outputs(timeline, emitters, max_bytes, verbose)
+    unfitted = [emitter for emitter in emitters if emitter.path not in written]
+    if unfitted:
+      emitters_lib.emit(timeline, unfitted, verbose, threads)
+    check_outputs(timeline, emitters, written)
+  except BaseException:
+    emitters_lib.abort(emitters)
+    raise
+  return emitters
+
+# Varint streams must decode back to the float table, and phrase tables
+# expand back to the packed one. Checked in their temp files, before they
+# replace anything.
+def check_outputs(timeline, emitters, written):
+  for emitter in emitters:
+    if isinstance(emitter, emitters_lib.PhraseEmitter):
+      source = written.get(emitter.path, timeline)
+      rows = [(track, pitch, ticks.to_ms(on), ticks.to_ms(off)) for track, pitch, on, off in source.tick_rows()]
+      with open(emitters_lib.temp_path(emitter.path), 'rb') as file:
+        phrases.check(rows[:emitter.count], file.read())
+    if isinstance(emitter, emitters_lib.VarintBinEmitter):
+      source = written.get(emitter.path, timeline)
+      scale = ticks.TICK_US / ticks.US_PER_SECOND
+      notes = [(track, pitch, on * scale, off * scale) for track, pitch, on, off in source.tick_rows()]
+      with open(emitters_lib.temp_path(emitter.path), 'rb') as file:
+        varint.check(notes[:emitter.count], file.read())
+
+# Stems of the output files of each board with --boards, else just the stem
+def board_stems(stem, num_boards=None):
+  if num_boards is None:
+    return [stem]
+  return [f"{stem}-board{board}" for board in range(num_boards)]
+
+# Write a song's outputs from command line options. With --boards, the song is
+# split across boards and each board's notes are written to their own files,
+# after checking the boards together still play every note.
+def write_song(timeline, args, out_dir='.', stem=OUTPUT_STEM, verbose=True):
+  parts = [timeline]
+  if args.boards is not None:
+    if isinstance(timeline, timeline_lib.MergedTimeline):
+      timeline = timeline.to_timeline()
+    try:
+      parts, report = boards.partition(timeline, args.boards)
+    except ValueError as error:
+      raise SystemExit(str(error))
+    boards.check(timeline, parts, report['voices'])
+    if verbose:
+      boards.print_report(report, timeline.summaries)
+
+  # Every board's outputs are finished and checked before any is replaced
+  step_delays = get_step_delays(args)
+  targets = get_targets(args)
+  prepared = []
+  try:
+    for part, part_stem in zip(parts, board_stems(stem, args.boards)):
+      if verbose and args.boards is not None:
+        print()
+      prepared += prepare_outputs(part, args.packed, out_dir, part_stem, verbose, args.varint, step_delays, args.fit, args.max_bytes, targets, args.threads, args.firmware)
+  except BaseException:
+    emitters_lib.abort(prepared)
+    raise
+  emitters_lib.commit(prepared, verbose)
 
-  # No tracks supplied, stop here
-  if len(sys.argv) < 3:
+# Write each output that has a budget from its own fitted timeline, returning
+# the timeline written to each path
+def fit_outputs(timeline, emitters, max_bytes=None, verbose=True):
+  if isinstance(timeline, timeline_lib.MergedTimeline):
+    timeline = timeline.to_timeline()
+
+  fits = {}
+  written = {}
+  for emitter in emitters:
+    limit = emitter.limit
+    sized = fit_lib.NOTE_BYTES.get(emitter.kind, 0) is not None
+    if limit is None and (max_bytes is None or not sized):
+      if verbose and max_bytes is not None:
+        print(f"\nWARNING: {emitter.kind} tables have no byte size, writing all of {emitter.path}")
+      continue
+
+    # Outputs of the same kind and budget, like a header and its .bin, share a fit
+    key = (emitter.kind, limit)
+    if key not in fits:
+      fits[key] = fit_lib.fit(timeline, emitter.kind, limit, max_bytes)
+      if verbose:
+        fit_lib.print_report(emitter.path, fits[key][2], timeline.summaries)
+    fitted, tick_us, _ = fits[key]
+
+    if emitter.kind == 'varint':
+      emitter.encoder = varint.Encoder(tick_us)
+    emitter.limit = None
+    emitters_lib.emit(fitted, [emitter], verbose)
+    written[emitter.path] = fitted
+  return written
+
+# Passes applied to a timeline before it is written, from command line options.
+# Normalizing first means voice allocation doesn't spend motors on duplicates.
+def process_timeline(timeline, args, verbose=True):
+  if (args.normalize or args.motors is not None) and isinstance(timeline, timeline_lib.MergedTimeline):
+    timeline = timeline.to_timeline()
+  if args.normalize:
+    timeline, report = normalize.normalize(timeline)
+    if verbose:
+      normalize.print_report(report)
+  if args.motors is not None:
+    sources = timeline.summaries
+    timeline, report = voices.allocate(timeline, args.motors, args.steal)
+    if verbose:
+      voices.print_report(report, sources)
+  return timeline
+
+# Step delay table for --step-delays, tuned by --calibration
+def get_step_delays(args):
+  if not args.step_delays and args.calibration is None:
+    return None
+  return load_step_delays(args.calibration)
+
+# Step delay table tuned by a calibration file, if any
+def load_step_delays(calibration_path=None):
+  try:
+    calibration = tuning.load_calibration(calibration_path) if calibration_path else None
+  except ValueError as error:
+    raise SystemExit(str(error))
+  return tuning.step_delay_table(tuning.load_pitch_table(), calibration)
+
+# Options that change the outputs, for the cache key
+def cache_options(args):
+  return {
+    'packed': args.packed,
+    'varint': args.varint,
+    'normalize': args.normalize,
+    'motors': args.motors,
+    'steal': args.steal,
+    'step_delays': bool(args.step_delays or args.calibration),
+    'calibration': cache.hash_file(args.calibration) if args.calibration else None,
+    'pitches': cache.hash_file(tuning.PITCHES_H),
+    'reader': args.reader,
+    'fit': args.fit,
+    'max_bytes': args.max_bytes,
+    'firmware': cache.hash_file(args.firmware) if args.firmware else None,
+    'boards': args.boards,
+  }
+
+# Add options for the files written
+def add_output_arguments(parser):
+  parser.add_argument('--packed', action='store_true', help='Emit the Pico header as a flat struct table of integer milliseconds')
+  parser.add_argument('--step-delays', action='store_true', help='Emit the Pico header with integer step delays and durations for each note')
+  parser.add_argument('--calibration', help='JSON map of motor index to tuning offset in cents (implies --step-delays)')
+  parser.add_argument('--varint', action='store_true', help='Also emit the whole song as a compressed varint note stream')
+  parser.add_argument('--fit', action='store_true', help='Fit the Thumby and Pebble outputs into their note limits instead of cutting them short')
+  parser.add_argument('--max-bytes', type=int, help='Fit every output into this many bytes on its target (implies --fit)')
+  parser.add_argument('--targets', help=f"Comma-separated outputs to write, from {', '.join(TARGETS)} (default: {','.join(DEFAULT_TARGETS)})")
+  parser.add_argument('--threads', type=int, default=1, help='Write this many outputs at once')
+  parser.add_argument('--firmware', help='Prebuilt PicoApp.uf2 to patch the uf2 target into')
+  parser.add_argument('--boards', type=int, help=f"Split the song across this many boards of {voices.DEFAULT_MOTORS} motors, writing <stem>-board<n> outputs for each")
+
+# Add options for the passes in process_timeline
+def add_process_arguments(parser):
+  parser.add_argument('--normalize', action='store_true', help='Remove zero length and duplicate notes, and merge overlapping notes of the same pitch')
+  parser.add_argument('--motors', type=int, help='Allocate notes to this many motors instead of one motor per track')
+  parser.add_argument('--steal', action='store_true', help='With --motors, cut the oldest note short instead of dropping new ones')
+  parser.add_argument('--reader', choices=READERS, default='builtin', help='MIDI file reader (default: builtin)')
+
+# Compile one song of a batch in a worker process
+def compile_song(path, tracks, args):
+  start = time.perf_counter()
+  stem = os.path.splitext(os.path.basename(path))[0]
+  timeline = load_song(path, tracks, args, verbose=False, lazy=True)
+  write_song(timeline, args, args.out, stem, False)
+  return len(timeline), time.perf_counter() - start
+
+# MIDI files in a directory, plus any files with the extra extensions
+def find_midis(dir, extra_extensions=[]):
+  extensions = MIDI_EXTENSIONS + extra_extensions
+  return sorted(
+    path for path in glob.glob(os.path.join(dir, '*'))
+    if os.path.splitext(path)[1].lower() in extensions
+  )
+
+# Compile a single MIDI file, or list its tracks if none are chosen. Tables
+# written by compile.py can be read back in place of a MIDI file.
+def run_compile(argv):
+  parser = argparse.ArgumentParser(prog='compile.py', description='Compile a MIDI file into note tables')
+  parser.add_argument('midi', help='MIDI file to compile, or a table written by compile.py')
+  parser.add_argument('tracks', nargs='?', help='Comma-separated track indexes to play (default for tables: all)')
+  add_output_arguments(parser)
+  parser.add_argument('--no-cache', action='store_true', help='Always recompile, even if the outputs are up to date')
+  add_process_arguments(parser)
+  args = parser.parse_args(argv)
+
+  file_name = args.midi
+  print(f"file_name: {file_name}")
+
+  # Same MIDI, tracks, targets and compiler as a previous run - leave outputs as they are
+  step_delays = get_step_delays(args)
+  targets = get_targets(args)
+  from_header = header.is_header(file_name)
+  key = None
+  if (args.tracks is not None or from_header) and not args.no_cache:
+    output_paths = [
+      path
+      for stem in board_stems(OUTPUT_STEM, args.boards)
+      for emitter in make_emitters(file_name, args.packed, stem=stem, use_varint=args.varint, step_delays=step_delays, targets=targets, firmware=args.firmware)
+      for path in emitter.paths()
+    ]
+    tracks = args.tracks.split(',') if args.tracks else []
+    key = cache.cache_key(file_name, tracks, output_paths, cache_options(args))
+    if cache.restore(key, output_paths):
+      print('\nOutputs are up to date (cached)')
+      return
+
+  if from_header:
+    timeline = load_song(file_name, args.tracks, args)
+    print(f"\nread {len(timeline)} notes")
+    print()
+    write_song(timeline, args)
+    if key is not None:
+      cache.store(key, output_paths)
+    return
+
+  # No tracks supplied, list them from the catalog if it's up to date, else
+  # from the MIDI file
+  if args.tracks is None:
+    tracks = None
+    if os.path.exists(catalog.CATALOG_PATH):
+      tracks = catalog.lookup(catalog.connect(), file_name)
+    if tracks is None:
+      tracks = describe_midi(file_name, args.reader)
+    print()
+    for track in tracks:
+      print(f"{track['track']}: {track['summary']}")
     print("\nChoose program indexes from above as extra program parameters")
     sys.exit(1)
 
+  # Load midi file
+  instruments = load_instruments(file_name, args.reader)
+  print()
+  for i, instrument in enumerate(instruments):
+    print(f"{i}: {instrument['summary']}")
+
   # Select instruments from constant list
   print()
-  play_tracks = sys.argv[2].split(',')
-  for i in range(0, len(play_tracks)):
-    data['instruments'].append(non_drum_instruments[int(play_tracks[i])])
-    print(f"using: {data['instruments'][i]['summary']}")
-
-  # Build list of events of on and off for all tracks
-  for (i, instrument) in enumerate(data['instruments']):
-    for note in instrument['pm_instrument'].notes:
-      add_event(i, note.pitch, note.start, note.end)
-
-  # Sort timeline by 'at' for list of events
-  data['timeline'] = sorted(data['timeline'], key = lambda p: p['on_at'])
-
-  # Compile C header file table
-  output = '// GENERATED WITH pico-pipes/compile.py\n\n'
-  output += f"#define NUM_NOTES {len(data['timeline'])}\n\n"
-  output += '// Order is track, pitch, on_at, off_at\n'
-  output += 'static const float* NOTE_TABLE[] = {\n'
-  for event in data['timeline']:
-    output += "  (float[]){ "
-    output += f"{event['track']}"
-    output += ", "
-    output += f"{event['pitch']}"
-    output += ", "
-    output += f"{round(event['on_at'], 5)}"
-    output += ", "
-    output += f"{round(event['off_at'], 5)}"
-    output += ' },\n'
-  output += '};\n'
-  print(f"\nbuild size: {len(output)} bytes")
-
-  # Write to Python file - must be as small as possible
-  with open(OUTPUT_NAME_PICO, 'w', newline='') as file:
-    file.write(output)
-    print(f"Wrote {OUTPUT_NAME_PICO}")
-
-  if len(data['timeline']) > THUMBY_MAX:
-    print('WARNING: Trimming to recommended maximum notes for Thumby')
-  thumby_timeline = data['timeline'][0:THUMBY_MAX]
-
-  # Build for Thumby
-  output = '# GENERATED WITH pico-pipes/compile.py\n\n'
-  output += 'FILE_NAME = ' + f"'{file_name.split('/')[-1]}'\n\n"
-  output += '# Order is track, pitch, on_at, off_at\n'
-  output += 'TRACK = [\n'
-  for event in thumby_timeline:
-    output += "  ["
-    output += f"{event['track']}"
-    output += ", "
-    output += f"{event['pitch']}"
-    output += ", "
-    output += f"{round(event['on_at'], 5)}"
-    output += ", "
-    output += f"{round(event['off_at'], 5)}"
-    output += ' ],\n'
-  output += ']\n'
-
-  # Write file of notes for thumby-dev/midi-player
-  with open(OUTPUT_NAME_THUMBY, 'w', newline='') as file:
-    file.write(output)
-    print(f"Wrote {OUTPUT_NAME_THUMBY}")
-
-  # Write Pebble output file
-  if len(data['timeline']) > PEBBLE_MAX:
-    print('WARNING: Trimming to recommended maximum notes for Pebble')
-  pebble_timeline = data['timeline'][0:PEBBLE_MAX]
-
-  output = '// GENERATED WITH pico-pipes/compile.py\n\n'
-  output += f"#define NUM_NOTES {len(pebble_timeline)}\n\n"
-  output += '// Order is track, pitch, on_at, off_at\n'
-  output += 'static const int* NOTE_TABLE[] = {\n'
-  for event in pebble_timeline:
-    output += "  (int[]){ "
-    output += f"{event['track']}"
-    output += ", "
-    output += f"{event['pitch']}"
-    output += ", "
-    output += f"{round(event['on_at'], 5) * 1000}"
-    output += ", "
-    output += f"{round(event['off_at'], 5) * 1000}"
-    output += ' },\n'
-  output += '};\n'
-  print(f"\nbuild size: {len(output)} bytes")
-
-  # Write to Python file - must be as small as possible
-  with open(OUTPUT_NAME_PEBBLE, 'w', newline='') as file:
-    file.write(output)
-    print(f"Wrote {OUTPUT_NAME_PEBBLE}")
+  timeline = build_timeline(instruments, args.tracks.split(','), file_name, lazy=True)
+  for summary in timeline.summaries:
+    print(f"using: {summary}")
+  timeline = process_timeline(timeline, args)
+
+  # Stream the timeline once into every output
+  print()
+  write_song(timeline, args)
+  if key is not None:
+    cache.store(key, output_paths)
+
+# Compile every MIDI file in a directory in parallel
+def run_batch(argv):
+  parser = argparse.ArgumentParser(prog='compile.py batch', description='Compile a directory of MIDI files')
+  parser.add_argument('dir', help='Directory of MIDI files')
+  parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of worker processes')
+  parser.add_argument('--manifest', help=f"JSON map of file name to track list (default: <dir>/{MANIFEST_NAME})")
+  parser.add_argument('--out', default='.', help='Directory to write outputs to')
+  parser.add_argument('--headers', action='store_true', help='Also convert tables written by compile.py, using all tracks unless listed in the manifest')
+  add_output_arguments(parser)
+  add_process_arguments(parser)
+  args = parser.parse_args(argv)
+
+  # Manifest maps MIDI file names to track lists, e.g. { "still-alive.mid": "0,1" }
+  manifest_path = args.manifest or os.path.join(args.dir, MANIFEST_NAME)
+  manifest = {}
+  if os.path.exists(manifest_path):
+    with open(manifest_path) as file:
+      manifest = json.load(file)
+  elif args.manifest or not args.headers:
+    raise SystemExit(f"No manifest at {manifest_path}, write a JSON map of MIDI file name to track list there")
+
+  paths = find_midis(args.dir, header.HEADER_EXTENSIONS if args.headers else [])
+  if args.headers and os.path.abspath(args.out) == os.path.abspath(args.dir):
+    raise SystemExit('Converted tables would overwrite their sources, choose another --out')
+  os.makedirs(args.out, exist_ok=True)
+
+  results = {}
+  jobs = []
+  for path in paths:
+    tracks = manifest.get(os.path.basename(path))
+    if tracks is None and not header.is_header(path):
+      results[path] = 'skipped, no tracks in manifest'
+      continue
+    if isinstance(tracks, str):
+      tracks = tracks.split(',')
+    jobs.append((path, tracks))
+
+  failed = 0
+  start = time.perf_counter()
+  if args.jobs == 1:
+    # No process pool to start for a single job
+    for path, tracks in jobs:
+      try:
+        results[path] = compile_song(path, tracks, args)
+      except Exception as error:
+        results[path] = f"error: {error}"
+        failed += 1
+  else:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+      futures = { pool.submit(compile_song, path, tracks, args): path for path, tracks in jobs }
+      for future in concurrent.futures.as_completed(futures):
+        try:
+          results[futures[future]] = future.result()
+        except Exception as error:
+          results[futures[future]] = f"error: {error}"
+          failed += 1
+  elapsed = time.perf_counter() - start
+
+  # Summary table
+  width = max([len(os.path.basename(path)) for path in paths] + [4])
+  print(f"{'File':<{width}}  {'Notes':>8}  {'Time':>8}")
+  for path in paths:
+    result = results[path]
+    name = os.path.basename(path)
+    if isinstance(result, str):
+      print(f"{name:<{width}}  {result}")
+    else:
+      print(f"{name:<{width}}  {result[0]:>8}  {result[1]:>7.2f}s")
+
+  compiled = len([result for result in results.values() if not isinstance(result, str)])
+  print(f"\nCompiled {compiled}/{len(paths)} files in {elapsed:.2f}s with {args.jobs} jobs")
+  if failed:
+    sys.exit(1)
+
+# Print polyphony, density and range stats for a MIDI file
+def run_analyze(argv):
+  parser = argparse.ArgumentParser(prog='compile.py analyze', description='Analyze the tracks of a MIDI file')
+  parser.add_argument('midi', help='MIDI file to analyze')
+  parser.add_argument('tracks', nargs='?', help='Comma-separated track indexes (default: all)')
+  parser.add_argument('--json', action='store_true', help='Print the analysis as JSON')
+  parser.add_argument('--reader', choices=READERS, default='builtin', help='MIDI file reader (default: builtin)')
+  args = parser.parse_args(argv)
+
+  instruments = load_instruments(args.midi, args.reader)
+  tracks = args.tracks.split(',') if args.tracks else range(len(instruments))
+  report = analyze.analyze(build_timeline(instruments, tracks, args.midi))
+
+  if args.json:
+    print(json.dumps(report, indent=2))
+  else:
+    analyze.print_report(report)
+
+# Store a file's tracks in the catalog, or the error reading them
+def catalog_file(db, path, digest, describe):
+  try:
+    catalog.store(db, path, digest, describe())
+  except Exception as error:
+    catalog.store(db, path, digest, [], str(error))
+
+# Index the tracks of directories of MIDI files, re-reading only files that
+# have changed, and list or search them without reading any MIDI file
+def run_catalog(argv):
+  parser = argparse.ArgumentParser(prog='compile.py catalog', description='Catalog and search the tracks of MIDI files')
+  parser.add_argument('dirs', nargs='*', help='Directories of MIDI files to add or update before searching')
+  parser.add_argument('--db', default=catalog.CATALOG_PATH, help=f"Catalog file (default: {catalog.CATALOG_PATH})")
+  parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of worker processes reading changed files')
+  parser.add_argument('--reader', choices=READERS, default='builtin', help='MIDI file reader (default: builtin)')
+  parser.add_argument('--name', help='Only files whose path contains this')
+  parser.add_argument('--program', help='Only tracks whose program name contains this, e.g. piano')
+  parser.add_argument('--min-notes', type=int, help='Only tracks with at least this many notes')
+  parser.add_argument('--max-polyphony', type=int, help='Only tracks with at most this many notes at once')
+  parser.add_argument('--min-pitch', type=int, help='Only tracks with no notes below this pitch')
+  parser.add_argument('--max-pitch', type=int, help='Only tracks with no notes above this pitch')
+  args = parser.parse_args(argv)
+
+  db = catalog.connect(args.db)
+  for dir in args.dirs:
+    start = time.perf_counter()
+    paths = find_midis(dir)
+    removed = catalog.prune(db, dir, paths)
+    changed = catalog.changed_files(db, paths, cache.hash_file)
+
+    # Only changed files are read, in parallel as in batch mode
+    if args.jobs == 1 or len(changed) < 2:
+      for path, digest in changed:
+        catalog_file(db, path, digest, lambda: describe_midi(path, args.reader))
+    else:
+      with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = { pool.submit(describe_midi, path, args.reader): (path, digest) for path, digest in changed }
+        for future in concurrent.futures.as_completed(futures):
+          catalog_file(db, *futures[future], future.result)
+    print(f"{dir}: {len(paths)} files, read {len(changed)} changed, removed {removed} in {time.perf_counter() - start:.2f}s")
+
+  rows = catalog.search(db, args.name, args.program, args.min_notes, args.max_polyphony, args.min_pitch, args.max_pitch)
+  catalog.print_tracks(rows)
+  for row in catalog.errors(db, args.name):
+    print(f"\n{os.path.relpath(row['path'])}: {row['error']}")
+  print(f"\n{len(rows)} tracks in {len(set(row['path'] for row in rows))} files")
+
+# Load a timeline from a table written by compile.py, or a MIDI file and tracks.
+# With lazy, MIDI notes are merged as they are read by the emitters.
+def load_song(path, tracks, args, verbose=True, lazy=False):
+  tracks = tracks.split(',') if isinstance(tracks, str) else tracks
+  if header.is_header(path):
+    timeline = header.read_header(path)
+    timeline = timeline.select(tracks) if tracks else timeline
+  elif tracks is None:
+    raise SystemExit('Choose tracks to load from a MIDI file')
+  else:
+    timeline = compile_midi(path, tracks, args.reader, lazy)
+  return process_timeline(timeline, args, verbose)
+
+# Render a song as it would sound on the motors to a WAV file
+def run_simulate(argv):
+  parser = argparse.ArgumentParser(prog='compile.py simulate', description='Render a song as played by the motors to a WAV file')
+  parser.add_argument('song', help='MIDI file, or a notes header written by compile.py')
+  parser.add_argument('tracks', nargs='?', help='Comma-separated track indexes, for MIDI files')
+  parser.add_argument('--out', help='WAV file to write (default: <song>.wav)')
+  parser.add_argument('--calibration', help='JSON map of motor index to tuning offset in cents')
+  parser.add_argument('--sample-rate', type=int, default=simulate.SAMPLE_RATE, help='Output sample rate')
+  add_process_arguments(parser)
+  args = parser.parse_args(argv)
+
+  timeline = load_song(args.song, args.tracks, args)
+  step_delays = load_step_delays(args.calibration)
+
+  start = time.perf_counter()
+  samples = simulate.render(timeline, step_delays, sample_rate=args.sample_rate)
+  out = args.out or os.path.splitext(os.path.basename(args.song))[0] + '.wav'
+  simulate.write_wav(out, samples, args.sample_rate)
+  print(f"Wrote {out} ({len(samples) / args.sample_rate:.1f}s of audio in {time.perf_counter() - start:.2f}s)")
+
+# Model main loop timing and report how late notes start
+def run_lateness(argv):
+  parser = argparse.ArgumentParser(prog='compile.py lateness', description='Model how late the main loop starts each note')
+  parser.add_argument('songs', nargs='+', help='Headers written by compile.py, directories of them, or MIDI files')
+  parser.add_argument('--tracks', help='Comma-separated track indexes, for MIDI files')
+  parser.add_argument('--loop-us', type=float, default=scheduler.LOOP_US, help='Cost of one pass of the main loop')
+  parser.add_argument('--step-us', type=float, default=scheduler.STEP_US, help='Extra cost of a motor tick that takes a step')
+  parser.add_argument('--calibration', help='JSON map of motor index to tuning offset in cents')
+  parser.add_argument('--max-p99-ms', type=float, help='Fail if any song has a 99th percentile lateness over this')
+  parser.add_argument('--json', action='store_true', help='Print the reports as JSON')
+  add_process_arguments(parser)
+  args = parser.parse_args(argv)
+
+  paths = []
+  for song in args.songs:
+    paths += sorted(glob.glob(os.path.join(song, '*.h'))) if os.path.isdir(song) else [song]
+
+  step_delays = load_step_delays(args.calibration)
+  reports = []
+  for path in paths:
+    timeline = load_song(path, args.tracks, args)
+    _, late_us = scheduler.note_starts(timeline, step_delays, args.loop_us, args.step_us)
+    reports.append(scheduler.lateness_report(os.path.basename(path), late_us))
+
+  if args.json:
+    print(json.dumps(reports, indent=2))
+  else:
+    scheduler.print_reports(reports)
+
+  if args.max_p99_ms is not None:
+    failed = [report['file'] for report in reports if report['p99_ms'] > args.max_p99_ms]
+    if failed:
+      print(f"\nOver {args.max_p99_ms}ms p99 lateness: {', '.join(failed)}")
+      sys.exit(1)
+
+# Recompile a song whenever its MIDI file is saved, until interrupted. Saves
+# are polled for, and a build waits until the file has stopped changing for
+# one poll. Outputs are written atomically and only replaced when they change,
+# and nothing is written when the chosen tracks' notes are the same as before.
+def run_watch(argv):
+  parser = argparse.ArgumentParser(prog='compile.py watch', description='Recompile a MIDI file each time it changes')
+  parser.add_argument('midi', help='MIDI file to watch, or a table written by compile.py')
+  parser.add_argument('tracks', nargs='?', help='Comma-separated track indexes to play (default for tables: all)')
+  parser.add_argument('--interval-ms', type=int, default=WATCH_INTERVAL_MS, help=f"How often to check the file for changes (default: {WATCH_INTERVAL_MS})")
+  add_output_arguments(parser)
+  add_process_arguments(parser)
+  args = parser.parse_args(argv)
+
+  # Options that are wrong whatever the song holds stop the watch before it starts
+  if args.tracks is None and not header.is_header(args.midi):
+    raise SystemExit('Choose tracks to load from a MIDI file')
+  make_emitters(args.midi, args.packed, use_varint=args.varint, step_delays=get_step_delays(args), targets=get_targets(args), firmware=args.firmware)
+
+  print(f"Watching {args.midi}, Ctrl-C to stop")
+  seen = None
+  built = None
+  notes_hash = None
+  try:
+    while True:
+      try:
+        stat = os.stat(args.midi)
+        current = (stat.st_mtime_ns, stat.st_size)
+      except FileNotFoundError:
+        # Some editors save by replacing the file
+        current = None
+
+      # Build once the file is the same as at the last poll
+      if current is not None and current == seen and current != built:
+        built = current
+        start = time.perf_counter()
+        try:
+          timeline = load_song(args.midi, args.tracks, args, verbose=False)
+          digest = hashlib.sha256(timeline.notes.tobytes()).hexdigest()
+          if digest == notes_hash:
+            print(f"{time.strftime('%H:%M:%S')} chosen tracks unchanged")
+          else:
+            write_song(timeline, args, verbose=False)
+            notes_hash = digest
+            print(f"{time.strftime('%H:%M:%S')} compiled {len(timeline)} notes in {(time.perf_counter() - start) * 1000:.0f}ms")
+        except (Exception, SystemExit) as error:
+          # A half-saved file can't be read, and a song that outgrew its
+          # targets may fit again, so either way wait for the next save
+          print(f"{time.strftime('%H:%M:%S')} error: {error}")
+      seen = current
+      time.sleep(args.interval_ms / 1000)
+  except KeyboardInterrupt:
+    pass
+
+# Check the built-in reader gives the same instruments and note times as
+# pretty_midi for some MIDI files
+def run_check_reader(argv):
+  parser = argparse.ArgumentParser(prog='compile.py check-reader', description='Compare the built-in MIDI reader with pretty_midi')
+  parser.add_argument('midis', nargs='+', help='MIDI files, or directories of them')
+  args = parser.parse_args(argv)
+
+  paths = []
+  for midi in args.midis:
+    paths += find_midis(midi) if os.path.isdir(midi) else [midi]
+
+  failed = []
+  for path in paths:
+    name = os.path.basename(path)
+    try:
+      start = time.perf_counter()
+      builtin = read_midi(path, 'builtin')
+      builtin_s = time.perf_counter() - start
+      start = time.perf_counter()
+      expected = read_midi(path, 'pretty_midi')
+      expected_s = time.perf_counter() - start
+    except Exception as error:
+      failed.append(name)
+      print(f"{name}: can't be read, {error}")
+      continue
+
+    problems = []
+    if len(builtin) != len(expected):
+      problems.append(f"{len(builtin)} instruments, expected {len(expected)}")
+    for i, (instrument, other) in enumerate(zip(builtin, expected)):
+      if (instrument.program, instrument.is_drum) != (other.program, other.is_drum):
+        problems.append(f"instrument {i} is program {instrument.program}, expected {other.program}")
+      notes = [(note.pitch, note.start, note.end) for note in instrument.notes]
+      other_notes = [(note.pitch, note.start, note.end) for note in other.notes]
+      if notes != other_notes:
+        problems.append(f"instrument {i} notes differ")
+
+    num_notes = sum(len(instrument.notes) for instrument in builtin)
+    if problems:
+      failed.append(name)
+      print(f"{name}: {'; '.join(problems)}")
+    else:
+      print(f"{name}: {num_notes} notes match ({builtin_s:.3f}s vs {expected_s:.3f}s)")
+
+  if failed:
+    print(f"\n{len(failed)}/{len(paths)} files differ or can't be read")
+    sys.exit(1)
+
+# Check that rounding every note time to the integer time base, and from there
+# to each target's units, stays within half a tick plus half a unit of the
+# MIDI file's times for some MIDI files
+def run_check_ticks(argv):
+  parser = argparse.ArgumentParser(prog='compile.py check-ticks', description='Check the time rounding error of every target stays bounded')
+  parser.add_argument('midis', nargs='+', help='MIDI files, or directories of them')
+  parser.add_argument('--reader', choices=READERS, default='builtin', help='MIDI file reader (default: builtin)')
+  args = parser.parse_args(argv)
+
+  paths = []
+  for midi in args.midis:
+    paths += find_midis(midi) if os.path.isdir(midi) else [midi]
+
+  # Base ticks, milliseconds of packed and Pebble tables, and every varint tick
+  units = sorted({ticks.TICK_US, 1000, varint.TICK_US, *fit_lib.TICK_STEPS_US})
+  failed = []
+  for path in paths:
+    instruments = load_instruments(path, args.reader)
+    timeline = build_timeline(instruments, range(len(instruments)), path)
+    times = np.concatenate([timeline.on, timeline.off])
+    base = ticks.to_ticks(times)
+    errors = []
+    try:
+      for unit_us in units:
+        errors.append(f"{unit_us}us: {ticks.check(times, base, unit_us):.2f}us")
+    except ValueError as error:
+      failed.append(path)
+      errors.append(str(error))
+    print(f"{os.path.basename(path)}: {len(timeline)} notes over {timeline.duration():.0f}s, max error {', '.join(errors)}")
+
+  if failed:
+    print(f"\n{len(failed)}/{len(paths)} files are out of bounds")
+    sys.exit(1)
+
+# Name of a song in a bundle, the file name without the suffix compile.py gave
+# the table, so notes.mid, notes.h and notes-pebble.h are all notes
+def song_name(path):
+  base = os.path.basename(path)
+  for suffix in [OUTPUT_SUFFIX_PEBBLE, OUTPUT_SUFFIX_VARINT]:
+    if base.endswith(suffix):
+      return base[:-len(suffix)]
+  return os.path.splitext(base)[0]
+
+# Songs of a directory to bundle. compile.py writes each song as several
+# tables, so only one file of each name is used: the MIDI file, else the Pico
+# header, else the first other table. Thumby readers are not tables.
+def bundle_files(dir):
+  def rank(path):
+    if os.path.splitext(path)[1].lower() in MIDI_EXTENSIONS:
+      return 0
+    return 1 if os.path.basename(path) == song_name(path) + OUTPUT_SUFFIX_PICO else 2
+
+  files = {}
+  for path in find_midis(dir, header.HEADER_EXTENSIONS):
+    if path.endswith(OUTPUT_SUFFIX_THUMBY_READER):
+      continue
+    name = song_name(path)
+    if name not in files or rank(path) < rank(files[name]):
+      files[name] = path
+  return sorted(files.values())
+
+# Bundle many songs into one blob with an index, so one flash holds a library
+def run_bundle(argv):
+  parser = argparse.ArgumentParser(prog='compile.py bundle', description='Bundle many songs into one blob with an index')
+  parser.add_argument('songs', nargs='+', help='MIDI files, tables written by compile.py, or directories of them')
+  parser.add_argument('--manifest', help=f"JSON map of MIDI file name to track list (default: <dir>/{MANIFEST_NAME})")
+  parser.add_argument('--out', default='bundle.bin', help='Bundle file to write')
+  parser.add_argument('--uf2', help='Also write the bundle as a UF2 of the flash region, for firmware built with NOTE_TABLE_FLASH')
+  parser.add_argument('--firmware', help='Prebuilt PicoApp.uf2 to patch the bundle into (with --uf2)')
+  parser.add_argument('--step-delays', action='store_true', help='Bundle timed rows with integer step delays and durations')
+  parser.add_argument('--calibration', help='JSON map of motor index to tuning offset in cents (implies --step-delays)')
+  add_process_arguments(parser)
+  args = parser.parse_args(argv)
+
+  paths = []
+  manifest = {}
+  for song in args.songs:
+    if os.path.isdir(song):
+      paths += bundle_files(song)
+      manifest_path = os.path.join(song, MANIFEST_NAME)
+      if os.path.exists(manifest_path) and not args.manifest:
+        with open(manifest_path) as file:
+          manifest.update(json.load(file))
+    else:
+      paths.append(song)
+  if args.manifest:
+    with open(args.manifest) as file:
+      manifest.update(json.load(file))
+
+  step_delays = get_step_delays(args)
+  songs = []
+  bundled = []
+  for path in paths:
+    tracks = manifest.get(os.path.basename(path))
+    if tracks is None and not header.is_header(path):
+      print(f"skipped {path}, no tracks in manifest")
+      continue
+
+    # Songs that can't be read are left out, as in batch mode
+    try:
+      timeline = load_song(path, tracks, args, verbose=False, lazy=True)
+      rows = b''.join(
+        emitters_lib.pack_row(track, pitch, on, off, step_delays)
+        for track, pitch, on, off in timeline.tick_rows()
+      )
+    except Exception as error:
+      print(f"skipped {path}, error: {error}")
+      continue
+    songs.append((song_name(path), rows, len(timeline), int(ticks.to_ms(ticks.to_ticks(timeline.duration())))))
+    bundled.append(path)
+
+  # Songs are found in the bundle by name
+  paths_by_name = {}
+  for (name, *_), path in zip(songs, bundled):
+    if name in paths_by_name:
+      raise SystemExit(f"{paths_by_name[name]} and {path} are both named {name} in the bundle, rename one")
+    paths_by_name[name] = path
+
+  kind = bundle.KIND_PACKED if step_delays is None else bundle.KIND_TIMED
+  data, shared = bundle.build(songs, kind)
+  with open(args.out, 'wb') as file:
+    file.write(data)
+  print(f"Wrote {args.out} ({len(songs)} songs, {len(data)} bytes, {shared} bytes of rows shared)")
+
+  if args.uf2:
+    if len(data) > uf2.REGION_SIZE:
+      raise SystemExit(f"Bundle is {len(data)} bytes, the flash region holds {uf2.REGION_SIZE}")
+    if args.firmware:
+      with open(args.firmware, 'rb') as file:
+        image = uf2.patch(file.read(), data)
+    else:
+      image = uf2.region_image(data)
+    with open(args.uf2, 'wb') as file:
+      file.write(image)
+    print(f"Wrote {args.uf2} ({len(image)} bytes)")
+
+# Subcommands - anything else is a MIDI file to compile
+COMMANDS = {
+  'analyze': run_analyze,
+  'batch': run_batch,
+  'bundle': run_bundle,
+  'catalog': run_catalog,
+  'check-reader': run_check_reader,
+  'check-ticks': run_check_ticks,
+  'lateness': run_lateness,
+  'simulate': run_simulate,
+  'watch': run_watch,
+}
+
+# The main function
+def main():
+  if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+    COMMANDS[sys.argv[1]](sys.argv[2:])
+  else:
+    run_compile(sys.argv[1:])
 
 if '__main__' in __name__:
   main()
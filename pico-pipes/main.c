@@ -22,19 +22,194 @@ float pitch_get_freq(int pitch) {
 struct Note {
   int track;
   int pitch;
-  float on_at;
-  float off_at;
+  uint32_t on_ms;
+  uint32_t duration_us;
+  uint32_t step_delay_us;
 };
 
+#if defined(NOTE_TABLE_FLASH)
 /**
- * Create Note structure.
+ * CRC-32 of some bytes, the same as Python's zlib.crc32().
  */
-struct Note note_create(const float *row) {
+uint32_t crc32(const uint8_t *data, uint32_t length) {
+  uint32_t crc = 0xFFFFFFFF;
+  for (uint32_t i = 0; i < length; i++) {
+    crc ^= data[i];
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc >> 1) ^ (0xEDB88320 & -(crc & 1));
+    }
+  }
+  return ~crc;
+};
+
+// Rows and length of the song being played from flash
+const uint8_t *note_flash_rows;
+uint32_t note_flash_num_notes;
+
+// Segments of the song being played from a bundle, the one holding the last
+// note read and the index of its first note
+const struct NoteBundleSegment *note_flash_segments;
+uint32_t note_flash_num_segments;
+uint32_t note_flash_segment;
+uint32_t note_flash_segment_start;
+
+/**
+ * Size of one row of the flashed table, or 0 if its kind is unknown.
+ */
+uint32_t note_flash_row_size() {
+  if (NOTE_FLASH_HEADER->kind == NOTE_FLASH_PACKED) return sizeof(struct PackedNote);
+  if (NOTE_FLASH_HEADER->kind == NOTE_FLASH_TIMED) return sizeof(struct TimedNote);
+  return 0;
+};
+
+/**
+ * Check a whole note table or bundle was flashed, so garbage is never played.
+ */
+int note_flash_valid() {
+  const struct NoteFlashHeader *header = NOTE_FLASH_HEADER;
+  uint32_t row_size = note_flash_row_size();
+  if (row_size == 0 || header->num_notes == 0) return FALSE;
+
+  // Everything checked must fit in the rest of the flash
+  uint32_t max_size = PICO_FLASH_SIZE_BYTES - NOTE_FLASH_OFFSET - sizeof(struct NoteFlashHeader);
+  uint32_t size;
+  if (header->magic == NOTE_FLASH_MAGIC) {
+    if (header->num_notes > max_size / row_size) return FALSE;
+    size = header->num_notes * row_size;
+  } else if (header->magic == NOTE_BUNDLE_MAGIC) {
+    if (header->num_notes > max_size / sizeof(struct NoteBundleSong)) return FALSE;
+
+    // Index, then every song's segments
+    size = header->num_notes * sizeof(struct NoteBundleSong);
+    uint32_t max_segments = (max_size - size) / sizeof(struct NoteBundleSegment);
+    uint32_t num_segments = 0;
+    for (uint32_t i = 0; i < header->num_notes; i++) {
+      const struct NoteBundleSong *song = &NOTE_BUNDLE_SONGS[i];
+      if (song->first_segment > max_segments || song->num_segments > max_segments - song->first_segment) return FALSE;
+      if (song->first_segment + song->num_segments > num_segments) num_segments = song->first_segment + song->num_segments;
+    }
+    size += num_segments * sizeof(struct NoteBundleSegment);
+
+    // Each song's segments hold all its notes, then up to the end of the last segment's rows
+    for (uint32_t i = 0; i < header->num_notes; i++) {
+      const struct NoteBundleSong *song = &NOTE_BUNDLE_SONGS[i];
+      uint64_t num_notes = 0;
+      for (uint32_t j = song->first_segment; j < song->first_segment + song->num_segments; j++) {
+        num_notes += NOTE_BUNDLE_SEGMENTS[j].num_notes;
+      }
+      if (song->num_notes == 0 || num_notes != song->num_notes) return FALSE;
+    }
+    for (uint32_t i = 0; i < num_segments; i++) {
+      const struct NoteBundleSegment *segment = &NOTE_BUNDLE_SEGMENTS[i];
+      if (segment->offset > max_size || segment->num_notes > (max_size - segment->offset) / row_size) return FALSE;
+      uint32_t end = segment->offset + segment->num_notes * row_size - sizeof(struct NoteFlashHeader);
+      if (end > size) size = end;
+    }
+  } else {
+    return FALSE;
+  }
+
+  return crc32((const uint8_t *)(header + 1), size) == header->crc32;
+};
+
+/**
+ * Number of songs in flash, more than one for a bundle.
+ */
+uint32_t note_flash_num_songs() {
+  return NOTE_FLASH_HEADER->magic == NOTE_BUNDLE_MAGIC ? NOTE_FLASH_HEADER->num_notes : 1;
+};
+
+/**
+ * Choose the song in flash that notes are read from.
+ */
+void note_flash_select(uint32_t song) {
+  const struct NoteFlashHeader *header = NOTE_FLASH_HEADER;
+  note_flash_segment = 0;
+  note_flash_segment_start = 0;
+  if (header->magic == NOTE_BUNDLE_MAGIC) {
+    note_flash_segments = &NOTE_BUNDLE_SEGMENTS[NOTE_BUNDLE_SONGS[song].first_segment];
+    note_flash_num_segments = NOTE_BUNDLE_SONGS[song].num_segments;
+    note_flash_num_notes = NOTE_BUNDLE_SONGS[song].num_notes;
+  } else {
+    note_flash_rows = (const uint8_t *)(header + 1);
+    note_flash_num_segments = 0;
+    note_flash_num_notes = header->num_notes;
+  }
+};
+
+/**
+ * Row of a note of the song in flash, setting the time its row times are from.
+ */
+const uint8_t *note_flash_row(uint32_t index, int32_t *start_ms) {
+  uint32_t row_size = note_flash_row_size();
+  *start_ms = 0;
+  if (note_flash_num_segments == 0) return note_flash_rows + index * row_size;
+
+  // Notes are read in order, so the segment only moves on, or back to the first for an earlier note
+  if (index < note_flash_segment_start) {
+    note_flash_segment = 0;
+    note_flash_segment_start = 0;
+  }
+  while (index - note_flash_segment_start >= note_flash_segments[note_flash_segment].num_notes
+      && note_flash_segment + 1 < note_flash_num_segments) {
+    note_flash_segment_start += note_flash_segments[note_flash_segment].num_notes;
+    note_flash_segment += 1;
+  }
+
+  const struct NoteBundleSegment *segment = &note_flash_segments[note_flash_segment];
+  *start_ms = segment->start_ms;
+  return (const uint8_t *)NOTE_FLASH_HEADER + segment->offset + (index - note_flash_segment_start) * row_size;
+};
+#endif
+
+/**
+ * Create Note structure from a row of the note table.
+ */
+struct Note note_create(int index) {
   struct Note n;
+#if defined(NOTE_TABLE_FLASH)
+  int32_t start_ms;
+  const uint8_t *flash_row = note_flash_row(index, &start_ms);
+  if (NOTE_FLASH_HEADER->kind == NOTE_FLASH_TIMED) {
+    const struct TimedNote *row = (const struct TimedNote *)flash_row;
+    n.track = row->track;
+    n.pitch = row->pitch;
+    n.on_ms = row->on_ms + start_ms;
+    n.duration_us = row->duration_us;
+    n.step_delay_us = row->step_delay_us;
+    return n;
+  }
+
+  const struct PackedNote *row = (const struct PackedNote *)flash_row;
+  n.track = row->track;
+  n.pitch = row->pitch;
+  n.on_ms = row->on_ms + start_ms;
+  n.duration_us = (row->off_ms - row->on_ms) * 1000;
+#elif defined(NOTE_TABLE_TIMED)
+  // Step delay and duration precomputed by compile.py --step-delays
+  const struct TimedNote *row = &NOTE_TABLE[index];
+  n.track = row->track;
+  n.pitch = row->pitch;
+  n.on_ms = row->on_ms;
+  n.duration_us = row->duration_us;
+  n.step_delay_us = row->step_delay_us;
+  return n;
+#elif defined(NOTE_TABLE_PACKED)
+  const struct PackedNote *row = &NOTE_TABLE[index];
+  n.track = row->track;
+  n.pitch = row->pitch;
+  n.on_ms = row->on_ms;
+  n.duration_us = (row->off_ms - row->on_ms) * 1000;
+#else
+  const float *row = NOTE_TABLE[index];
   n.track = row[0];
   n.pitch = row[1];
-  n.on_at = row[2];
-  n.off_at = row[3];
+  n.on_ms = row[2] * 1000;
+  n.duration_us = (row[3] - row[2]) * 1000000;
+#endif
+
+  // Set delay from pitch frequency
+  n.step_delay_us = 1000000 / pitch_get_freq(n.pitch);
 
   return n;
 };
@@ -47,7 +222,7 @@ struct Motor {
   uint64_t last_step_us;
   uint64_t step_delay_us;
   uint64_t note_start_us;
-  uint64_t note_duration_ms;
+  uint64_t note_duration_us;
 };
 
 /**
@@ -60,7 +235,7 @@ struct Motor motor_create(int pin) {
   m.last_step_us = 0;
   m.step_delay_us = 0;
   m.note_start_us = 0;
-  m.note_duration_ms = 0;
+  m.note_duration_us = 0;
 
   // GPIO init
   gpio_init(pin);
@@ -77,10 +252,8 @@ void motor_set_note(struct Motor *m, struct Note n) {
 
   // Duration control
   m->note_start_us = to_us_since_boot(get_absolute_time());
-  m->note_duration_ms = (n.off_at - n.on_at) * 1000;
-
-  // Set delay from pitch frequency
-  m->step_delay_us = 1000000 / pitch_get_freq(n.pitch);
+  m->note_duration_us = n.duration_us;
+  m->step_delay_us = n.step_delay_us;
 };
 
 /**
@@ -90,7 +263,7 @@ void motor_tick(struct Motor *m) {
   uint64_t now_us = to_us_since_boot(get_absolute_time());
 
   // Turn off?
-  if (now_us - m->note_start_us > (m->note_duration_ms * 1000)) {
+  if (now_us - m->note_start_us > m->note_duration_us) {
     m->is_on = FALSE;
   }
 
@@ -108,49 +281,103 @@ void motor_tick(struct Motor *m) {
 
 //////////////////////////////////////////// Main loop /////////////////////////////////////////////
 
-const int MOTOR_1_PIN = 5;
-const int MOTOR_2_PIN = 4;
-const int MOTOR_3_PIN = 3;
-const int MOTOR_4_PIN = 2;
+// Motor pins, indexed by the note track (or motor, with compile.py --motors)
+#define NUM_MOTORS 4
+const int MOTOR_PINS[NUM_MOTORS] = { 5, 4, 3, 2 };
+
+#if defined(BOARD_SYNC)
+// Boards playing parts of one song (compile.py --boards) share a sync line:
+// their sync pins wired together. Each board holds it low until it is ready,
+// so it only reads high once every board is, and they all start together.
+#define BOARD_SYNC_PIN 6
+// Time every board has to see the line high before any pulls it low again
+#define BOARD_SYNC_HOLD_MS 10
 
 /**
- * Entry point.
+ * Hold the sync line low, as this board isn't ready to play.
  */
-int main() {
-  // Create motors
-  struct Motor motor1 = motor_create(MOTOR_1_PIN);
-  struct Motor motor2 = motor_create(MOTOR_2_PIN);
-  struct Motor motor3 = motor_create(MOTOR_3_PIN);
-  struct Motor motor4 = motor_create(MOTOR_4_PIN);
+void board_sync_init() {
+  gpio_init(BOARD_SYNC_PIN);
+  gpio_pull_up(BOARD_SYNC_PIN);
+  gpio_put(BOARD_SYNC_PIN, 0);
+  gpio_set_dir(BOARD_SYNC_PIN, GPIO_OUT);
+};
+
+/**
+ * Let go of the sync line and wait until every board has, then hold it low
+ * again while playing.
+ */
+void board_sync() {
+  gpio_set_dir(BOARD_SYNC_PIN, GPIO_IN);
+  while (!gpio_get(BOARD_SYNC_PIN)) {
+    tight_loop_contents();
+  }
+
+  sleep_ms(BOARD_SYNC_HOLD_MS);
+  gpio_set_dir(BOARD_SYNC_PIN, GPIO_OUT);
+};
+#endif
+
+/**
+ * Play the note table from the start, until the last note has started.
+ */
+void play(struct Motor motors[]) {
+#if defined(BOARD_SYNC)
+  board_sync();
+#endif
+
+  // Note times are from the start of the song
+  uint64_t start_ms = get_ms_now();
 
   // Pre-load first note
   int note_index = 0;
-  struct Note next_note = note_create(NOTE_TABLE[note_index]);
+  struct Note next_note = note_create(note_index);
 
   while (true) {
-    motor_tick(&motor1);
-    motor_tick(&motor2);
-    motor_tick(&motor3);
-    motor_tick(&motor4);
+    for (int i = 0; i < NUM_MOTORS; i++) {
+      motor_tick(&motors[i]);
+    }
 
     // End?
-    if (note_index == NUM_NOTES - 1) return 0;
+    if (note_index == NUM_NOTES - 1) return;
 
     // Update next event
-    if (get_ms_now() > next_note.on_at * 1000) {
-      // One motor per track
-      if (next_note.track == 0) {
-        motor_set_note(&motor1, next_note);
-      } else if (next_note.track == 1) {
-        motor_set_note(&motor2, next_note);
-      } else if (next_note.track == 2) {
-        motor_set_note(&motor3, next_note);
-      } else if (next_note.track == 3) {
-        motor_set_note(&motor4, next_note);
+    if (get_ms_now() - start_ms > next_note.on_ms) {
+      // Track is the motor index, tracks without a motor are skipped
+      if (next_note.track < NUM_MOTORS) {
+        motor_set_note(&motors[next_note.track], next_note);
       }
 
       note_index += 1;
-      next_note = note_create(NOTE_TABLE[note_index]);
+      next_note = note_create(note_index);
     }
   }
 };
+
+/**
+ * Entry point.
+ */
+int main() {
+  // Create motors
+  struct Motor motors[NUM_MOTORS];
+  for (int i = 0; i < NUM_MOTORS; i++) {
+    motors[i] = motor_create(MOTOR_PINS[i]);
+  }
+#if defined(BOARD_SYNC)
+  board_sync_init();
+#endif
+
+#if defined(NOTE_TABLE_FLASH)
+  // Nothing to play until a song is flashed
+  if (!note_flash_valid()) return 0;
+
+  // Play every song in flash in turn
+  for (uint32_t song = 0; song < note_flash_num_songs(); song++) {
+    note_flash_select(song);
+    play(motors);
+  }
+#else
+  play(motors);
+#endif
+  return 0;
+};
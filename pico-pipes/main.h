@@ -5,4 +5,72 @@
 #define FALSE 0
 
 #include "pitches.h"
+
+// Row of a packed note table (compile.py --packed), times in milliseconds
+struct PackedNote {
+  uint8_t track;
+  uint8_t pitch;
+  uint32_t on_ms;
+  uint32_t off_ms;
+};
+
+// Row of a timed note table (compile.py --step-delays)
+struct TimedNote {
+  uint8_t track;
+  uint8_t pitch;
+  uint32_t on_ms;
+  uint32_t duration_us;
+  uint32_t step_delay_us;
+};
+
+#if defined(NOTE_TABLE_FLASH)
+#include "hardware/regs/addressmap.h"
+
+// Note table is read from a reserved region of flash instead of notes.h, so
+// songs can be flashed without rebuilding (compile.py --targets uf2). The
+// firmware must fit below this offset.
+#define NOTE_FLASH_OFFSET (1024 * 1024)
+#define NOTE_FLASH_MAGIC 0x544E5050
+#define NOTE_FLASH_PACKED 1
+#define NOTE_FLASH_TIMED 2
+
+// Start of the flash region, followed by num_notes rows of PackedNote or TimedNote
+struct NoteFlashHeader {
+  uint32_t magic;
+  uint32_t kind;
+  uint32_t num_notes;
+  uint32_t crc32;
+};
+
+// A bundle of many songs (compile.py bundle) has the same header with this
+// magic and num_notes holding the number of songs, then one NoteBundleSong
+// per song, then every song's NoteBundleSegments. The CRC covers everything
+// after the header.
+#define NOTE_BUNDLE_MAGIC 0x53425050
+#define NOTE_BUNDLE_NAME_SIZE 24
+
+// Index entry of a song in a bundle, its notes are those of num_segments
+// segments from first_segment, in order
+struct NoteBundleSong {
+  char name[NOTE_BUNDLE_NAME_SIZE];
+  uint32_t first_segment;
+  uint32_t num_segments;
+  uint32_t num_notes;
+  uint32_t duration_ms;
+};
+
+// Run of a song's notes, its rows start offset bytes from the header with
+// times from start_ms into the song. Songs share the rows of repeated sections.
+struct NoteBundleSegment {
+  uint32_t offset;
+  uint32_t num_notes;
+  int32_t start_ms;
+};
+
+#define NOTE_FLASH_HEADER ((const struct NoteFlashHeader *)(XIP_BASE + NOTE_FLASH_OFFSET))
+#define NOTE_BUNDLE_SONGS ((const struct NoteBundleSong *)(NOTE_FLASH_HEADER + 1))
+#define NOTE_BUNDLE_SEGMENTS ((const struct NoteBundleSegment *)(NOTE_BUNDLE_SONGS + NOTE_FLASH_HEADER->num_notes))
+#define NUM_NOTES note_flash_num_notes
+#else
 #include "notes.h"
+#endif
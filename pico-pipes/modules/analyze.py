@@ -0,0 +1,89 @@
+import numpy as np
+
+# Lowest pitch with a frequency in pitches.h - motors can't play below this
+PLAYABLE_MIN_PITCH = 21
+# Highest MIDI pitch
+PLAYABLE_MAX_PITCH = 127
+# Window for the notes per second peak
+RATE_WINDOW_S = 1.0
+
+# Most notes sounding at once. At each note start, that is the notes started so
+# far minus those ended by then - a note ending as another starts doesn't overlap.
+def max_polyphony(on, off):
+  if len(on) == 0:
+    return 0
+  starts = np.sort(on)
+  ends = np.sort(np.maximum(on, off))
+  ended = np.searchsorted(ends, starts, side='right')
+  return int((np.arange(1, len(starts) + 1) - ended).max())
+
+# Most note starts in any window of window_s seconds
+def peak_rate(on, window_s=RATE_WINDOW_S):
+  if len(on) == 0:
+    return 0
+  on = np.sort(on)
+  ends = np.searchsorted(on, on + window_s, side='left')
+  return int((ends - np.arange(len(on))).max())
+
+# Stats for one group of notes
+def note_stats(notes):
+  on = notes['on']
+  off = notes['off']
+  pitches = notes['pitch']
+  if len(notes) == 0:
+    return {
+      'notes': 0,
+      'max_polyphony': 0,
+      'peak_notes_per_second': 0,
+      'pitch_min': None,
+      'pitch_max': None,
+      'unplayable_notes': 0,
+      'start': 0.0,
+      'end': 0.0,
+    }
+
+  return {
+    'notes': int(len(notes)),
+    'max_polyphony': max_polyphony(on, off),
+    'peak_notes_per_second': peak_rate(on),
+    'pitch_min': int(pitches.min()),
+    'pitch_max': int(pitches.max()),
+    'unplayable_notes': int(((pitches < PLAYABLE_MIN_PITCH) | (pitches > PLAYABLE_MAX_PITCH)).sum()),
+    'start': float(on.min()),
+    'end': float(off.max()),
+  }
+
+# Analyze a timeline, per track and as a whole
+def analyze(timeline):
+  notes = timeline.notes
+  tracks = []
+
+  # Group rows by track with one stable sort instead of a mask per track
+  order = np.argsort(notes['track'], kind='stable')
+  by_track = notes[order]
+  bounds = np.searchsorted(by_track['track'], np.arange(len(timeline.summaries) + 1))
+  for track, summary in enumerate(timeline.summaries):
+    stats = note_stats(by_track[bounds[track]:bounds[track + 1]])
+    tracks.append({ 'track': track, 'summary': summary, **stats })
+
+  song = note_stats(notes)
+  return {
+    'file': timeline.file_name,
+    'duration': song['end'],
+    'playable_range': [PLAYABLE_MIN_PITCH, PLAYABLE_MAX_PITCH],
+    **song,
+    'tracks': tracks,
+  }
+
+# Print an analysis as a table
+def print_report(report):
+  print(f"\n{'Track':<45} {'Notes':>7} {'Poly':>5} {'Peak/s':>7} {'Range':>8} {'Unplayable':>11} {'Length':>8}")
+  rows = report['tracks'] + [{ **report, 'summary': 'All selected tracks' }]
+  for row in rows:
+    pitch_range = f"{row['pitch_min']}-{row['pitch_max']}" if row['notes'] else '-'
+    print(
+      f"{row['summary'][:45]:<45} {row['notes']:>7} {row['max_polyphony']:>5} "
+      f"{row['peak_notes_per_second']:>7} {pitch_range:>8} {row['unplayable_notes']:>11} "
+      f"{row['end']:>7.1f}s"
+    )
+  print(f"\nduration: {report['duration']:.2f}s, playable pitches: {PLAYABLE_MIN_PITCH}-{PLAYABLE_MAX_PITCH}")
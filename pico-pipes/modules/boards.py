@@ -0,0 +1,79 @@
+import numpy as np
+
+from modules import voices
+
+# Split a timeline across num_boards boards of motors_per_board motors each,
+# returning one timeline per board and a report. Each track (or motor, after
+# voices.allocate) is a voice that plays on one board. Voices with the most
+# notes are placed first, each on the board with the fewest notes so far that
+# still has a free motor, so every board gets at least one voice that plays.
+# Times are not shifted, so every board shares the song's time base.
+def partition(timeline, num_boards, motors_per_board=voices.DEFAULT_MOTORS):
+  if num_boards < 1:
+    raise ValueError('Need at least one board')
+  # Voices are the tracks that play notes, which after --motors are motors
+  # rather than the source tracks the summaries name
+  tracks = timeline.tracks
+  num_voices = int(tracks.max()) + 1 if len(timeline) else 0
+  if num_voices > num_boards * motors_per_board:
+    raise ValueError(
+      f"{num_voices} voices don't fit on {num_boards} boards of {motors_per_board} motors, "
+      f"choose fewer tracks or allocate notes to at most {num_boards * motors_per_board} with --motors"
+    )
+
+  # A board with no notes would play an empty table, which the firmware can't
+  counts = np.bincount(tracks, minlength=num_voices)
+  playing = int(np.count_nonzero(counts))
+  if num_boards > playing:
+    raise ValueError(f"{playing} voices play notes, too few for {num_boards} boards, choose at most {playing} boards")
+
+  board_voices = [[] for _ in range(num_boards)]
+  loads = [0] * num_boards
+  for voice in np.argsort(-counts, kind='stable').tolist():
+    board = min(
+      (board for board in range(num_boards) if len(board_voices[board]) < motors_per_board),
+      key=lambda board: loads[board]
+    )
+    board_voices[board].append(voice)
+    loads[board] += int(counts[voice])
+
+  # Motors of a board play its voices in their original order
+  board_voices = [sorted(board) for board in board_voices]
+  parts = [timeline.select(board) for board in board_voices]
+  report = {
+    'boards': num_boards,
+    'notes': len(timeline),
+    'voices': board_voices,
+    'board_notes': [len(part) for part in parts],
+  }
+  return parts, report
+
+# Put board timelines back together, each board's motors mapped back to the
+# voices of the original timeline
+def union(parts, board_voices):
+  notes = []
+  for part, board in zip(parts, board_voices):
+    rows = part.notes.copy()
+    if len(board):
+      rows['track'] = np.array(board, dtype=np.uint8)[rows['track']]
+    notes.append(rows)
+  notes = np.concatenate(notes)
+  return notes[np.lexsort((notes['off'], notes['pitch'], notes['track'], notes['on']))]
+
+# Raise if the boards together don't play exactly the notes of the original
+def check(original, parts, board_voices):
+  notes = original.notes
+  expected = notes[np.lexsort((notes['off'], notes['pitch'], notes['track'], notes['on']))]
+  actual = union(parts, board_voices)
+  if len(actual) != len(expected):
+    raise ValueError(f"Boards play {len(actual)} notes, the song has {len(expected)}")
+  different = np.flatnonzero(actual != expected)
+  if len(different):
+    raise ValueError(f"Boards differ from the song at note {different[0]}: {actual[different[0]]} != {expected[different[0]]}")
+
+# Print a partition report
+def print_report(report, summaries):
+  print(f"\nboards: {report['notes']} notes on {report['boards']} boards")
+  for board, (board_voices, count) in enumerate(zip(report['voices'], report['board_notes'])):
+    names = [summaries[voice] if voice < len(summaries) else f"Track {voice}" for voice in board_voices]
+    print(f"  board {board}: {count} notes from {', '.join(names) or 'nothing'}")
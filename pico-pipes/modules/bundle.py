@@ -0,0 +1,211 @@
+import argparse
+import struct
+import zlib
+
+# Bundle of many songs' note tables, which can fill the flash region read by
+# firmware built with NOTE_TABLE_FLASH:
+#   header:   magic, kind of rows, num_songs, CRC-32 of everything after the header
+#   index:    one SONG entry per song - name, first segment, num_segments,
+#             num_notes, duration_ms
+#   segments: one SEGMENT per run of a song's notes - offset of its rows from
+#             the start of the bundle, num_notes, and start_ms, the time in the
+#             song its row times are from
+#   rows:     packed or timed note rows, times from their segment's start_ms
+# A song plays its segments' rows one after the other. Rows are relative to
+# their segment, so a section repeated later in a song, or in another song,
+# is a segment pointing at rows already in the bundle instead of new ones.
+HEADER = struct.Struct('<IIII')
+MAGIC = 0x53425050
+# Index entry matching 'struct NoteBundleSong' in main.h
+NAME_SIZE = 24
+SONG = struct.Struct(f"<{NAME_SIZE}sIIII")
+# Segment matching 'struct NoteBundleSegment', start_ms is signed as shared
+# rows may start part way into the run they were stored with
+SEGMENT = struct.Struct('<IIi')
+# Kinds of rows, the same as the flash region's, and the row of each - packed
+# is track, pitch, on_ms, off_ms and timed track, pitch, on_ms, duration_us,
+# step_delay_us
+KIND_PACKED = 1
+KIND_TIMED = 2
+ROWS = {KIND_PACKED: struct.Struct('<BBxxII'), KIND_TIMED: struct.Struct('<BBxxIII')}
+RECORD_SIZES = {kind: row.size for kind, row in ROWS.items()}
+# Fewest notes worth a segment of their own rather than storing them again
+MIN_REPEAT = 8
+# Earlier places a repeat is looked for at, newest first, to bound the search
+MAX_CANDIDATES = 16
+
+# Row with times moved earlier by delta_ms
+def shift(kind, row, delta_ms):
+  if kind == KIND_PACKED:
+    return row[:2] + (row[2] - delta_ms, row[3] - delta_ms)
+  return row[:2] + (row[2] - delta_ms,) + row[3:]
+
+# Rows of a song, with reversed packed notes ending as they start, like timed
+# ones, so no row time falls before its segment's start
+def read_rows(kind, rows):
+  rows = list(ROWS[kind].iter_unpack(rows))
+  if kind == KIND_PACKED:
+    rows = [(track, pitch, on_ms, max(on_ms, off_ms)) for track, pitch, on_ms, off_ms in rows]
+  return rows
+
+# What a row holds apart from its time, with the gap from the row before, so
+# runs of rows match wherever they start
+def tokens(kind, rows):
+  out = []
+  for i, row in enumerate(rows):
+    gap = row[2] - rows[i - 1][2] if i else 0
+    rest = (row[3] - row[2],) if kind == KIND_PACKED else row[3:]
+    out.append((row[0], row[1], gap) + rest)
+  return out
+
+# Key of the MIN_REPEAT tokens from start, ignoring the first token's gap
+def window_key(tokens, start):
+  first = tokens[start]
+  return (first[:2] + first[3:],) + tuple(tokens[start + 1:start + MIN_REPEAT])
+
+# Longest run of stored rows that matches a song's tokens from index, as
+# (offset, length), or (0, 0) if none is MIN_REPEAT long. Runs are stored with
+# no gap before their first row, so a match never crosses into another run.
+def find_repeat(stored, windows, song, index):
+  if index + MIN_REPEAT > len(song):
+    return 0, 0
+  best = (0, 0)
+  for offset in reversed(windows.get(window_key(song, index), [])[-MAX_CANDIDATES:]):
+    length = MIN_REPEAT
+    while (index + length < len(song) and offset + length < len(stored)
+        and stored[offset + length] == song[index + length]):
+      length += 1
+    if length > best[1]:
+      best = (offset, length)
+  return best
+
+# Build a bundle from (name, rows, num_notes, duration_ms) songs, rows with
+# times from the start of the song, returning the bundle and how many bytes of
+# rows were shared. Each song is cut into runs of rows already in the bundle,
+# found by hashing every MIN_REPEAT rows and extended as far as they match,
+# and runs of new rows between them.
+def build(songs, kind=KIND_PACKED):
+  row_struct = ROWS[kind]
+  stored_rows = []
+  stored_tokens = []
+  windows = {}
+  song_segments = []
+  shared = 0
+
+  def store(row, token):
+    stored_rows.append(row)
+    stored_tokens.append(token)
+    start = len(stored_tokens) - MIN_REPEAT
+    if start >= 0:
+      windows.setdefault(window_key(stored_tokens, start), []).append(start)
+
+  for _, rows, _, _ in songs:
+    rows = read_rows(kind, rows)
+    song = tokens(kind, rows)
+    segments = []
+    run = None
+    index = 0
+    while index < len(rows):
+      offset, length = find_repeat(stored_tokens, windows, song, index)
+      if length >= MIN_REPEAT:
+        if run is not None:
+          segments.append(run)
+          run = None
+        segments.append([offset, length, rows[index][2] - stored_rows[offset][2]])
+        shared += length * row_struct.size
+        index += length
+        continue
+
+      # New row, the first of a run stored with no gap so matches can't
+      # continue into it from the run before
+      token = song[index]
+      if run is None:
+        run = [len(stored_rows), 0, rows[index][2]]
+        token = token[:2] + (None,) + token[3:]
+      store(shift(kind, rows[index], run[2]), token)
+      run[1] += 1
+      index += 1
+    if run is not None:
+      segments.append(run)
+    song_segments.append(segments)
+
+  num_segments = sum(len(segments) for segments in song_segments)
+  rows_start = HEADER.size + SONG.size * len(songs) + SEGMENT.size * num_segments
+  index = bytearray()
+  segment_table = bytearray()
+  first = 0
+  for (name, _, num_notes, duration_ms), segments in zip(songs, song_segments):
+    encoded = name.encode('utf-8')[:NAME_SIZE - 1]
+    index += SONG.pack(encoded, first, len(segments), num_notes, duration_ms)
+    for offset, length, start_ms in segments:
+      segment_table += SEGMENT.pack(rows_start + offset * row_struct.size, length, start_ms)
+    first += len(segments)
+
+  data = b''.join(row_struct.pack(*row) for row in stored_rows)
+  body = bytes(index + segment_table) + data
+  return HEADER.pack(MAGIC, kind, len(songs), zlib.crc32(body)) + body, shared
+
+# Whether some bytes start with a bundle header
+def is_bundle(data):
+  return len(data) >= HEADER.size and HEADER.unpack_from(data)[0] == MAGIC
+
+# Read a bundle into its kind and a list of songs, checking its CRC. Each song
+# is a dict of name, num_segments, num_notes, duration_ms and rows, with times
+# from the start of the song as they were given to build().
+def read(data):
+  magic, kind, num_songs, crc = HEADER.unpack_from(data)
+  if magic != MAGIC:
+    raise ValueError('Not a song bundle')
+  row_struct = ROWS[kind]
+
+  entries = [SONG.unpack_from(data, HEADER.size + SONG.size * i) for i in range(num_songs)]
+  segments_start = HEADER.size + SONG.size * num_songs
+  num_segments = max([first + count for _, first, count, _, _ in entries] + [0])
+  end = segments_start + SEGMENT.size * num_segments
+  if end > len(data):
+    raise ValueError('Song bundle is damaged')
+  segments = [SEGMENT.unpack_from(data, segments_start + SEGMENT.size * i) for i in range(num_segments)]
+  end = max([end] + [offset + count * row_struct.size for offset, count, _ in segments])
+  if end > len(data) or zlib.crc32(data[HEADER.size:end]) != crc:
+    raise ValueError('Song bundle is damaged')
+
+  songs = []
+  for name, first, count, num_notes, duration_ms in entries:
+    rows = bytearray()
+    for offset, length, start_ms in segments[first:first + count]:
+      for row in row_struct.iter_unpack(data[offset:offset + length * row_struct.size]):
+        rows += row_struct.pack(*shift(kind, row, -start_ms))
+    songs.append({
+      'name': name.rstrip(b'\0').decode('utf-8', 'replace'),
+      'num_segments': count,
+      'num_notes': num_notes,
+      'duration_ms': duration_ms,
+      'rows': bytes(rows),
+    })
+  return kind, songs
+
+if '__main__' in __name__:
+  # List the songs of a bundle, or extract one song's rows
+  parser = argparse.ArgumentParser(description='Inspect a song bundle written by compile.py bundle')
+  parser.add_argument('bundle', help='Bundle .bin file')
+  parser.add_argument('--extract', help='Name of a song to write the rows of')
+  parser.add_argument('--out', help='File to write the extracted rows to (default: <name>.bin)')
+  args = parser.parse_args()
+
+  with open(args.bundle, 'rb') as file:
+    kind, songs = read(file.read())
+
+  if args.extract:
+    song = next((song for song in songs if song['name'] == args.extract), None)
+    if song is None:
+      raise SystemExit(f"No song named {args.extract}")
+    out = args.out or f"{song['name']}.bin"
+    with open(out, 'wb') as file:
+      file.write(song['rows'])
+    print(f"Wrote {out} ({song['num_notes']} notes)")
+  else:
+    print(f"{len(songs)} {'timed' if kind == KIND_TIMED else 'packed'} songs")
+    width = max([len(song['name']) for song in songs] + [4])
+    print(f"{'Name':<{width}} {'Segments':>8} {'Notes':>7} {'Length':>8}")
+    for song in songs:
+      print(f"{song['name']:<{width}} {song['num_segments']:>8} {song['num_notes']:>7} {song['duration_ms'] / 1000:>7.1f}s")
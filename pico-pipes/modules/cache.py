@@ -0,0 +1,72 @@
+import filecmp
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+# Cache of compiled outputs, in the CWD
+CACHE_DIR = './.compile-cache'
+# Number of compiled songs to keep before the oldest are removed
+CACHE_MAX_ENTRIES = 32
+# Directory containing compile.py and modules/
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Hash a file's content
+def hash_file(path):
+  digest = hashlib.sha256()
+  with open(path, 'rb') as file:
+    for chunk in iter(lambda: file.read(1 << 16), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+# Compiler version, from the source of compile.py and its modules
+def compiler_version():
+  digest = hashlib.sha256()
+  sources = [os.path.join(SOURCE_DIR, 'compile.py')]
+  sources += sorted(glob.glob(os.path.join(SOURCE_DIR, 'modules', '*.py')))
+  for path in sources:
+    digest.update(hash_file(path).encode())
+  return digest.hexdigest()
+
+# Key for a MIDI file compiled with some tracks and options to some output files
+def cache_key(midi_path, tracks, output_paths, options=None):
+  key = json.dumps({
+    'midi': hash_file(midi_path),
+    'name': os.path.basename(midi_path),
+    'tracks': [str(track) for track in tracks],
+    'targets': [os.path.basename(path) for path in output_paths],
+    'options': options or {},
+    'compiler': compiler_version(),
+  }, sort_keys=True)
+  return hashlib.sha256(key.encode()).hexdigest()
+
+# Put cached outputs in place, leaving files that already match untouched
+def restore(key, output_paths):
+  entry = os.path.join(CACHE_DIR, key)
+  cached = [os.path.join(entry, os.path.basename(path)) for path in output_paths]
+  if not all(os.path.exists(path) for path in cached):
+    return False
+
+  for cached_path, path in zip(cached, output_paths):
+    if os.path.exists(path) and filecmp.cmp(cached_path, path, shallow=False):
+      continue
+    # Copied next to the output and moved over it, so it is never half there
+    temp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    shutil.copyfile(cached_path, temp)
+    os.replace(temp, path)
+
+  # Most recently used entries are kept longest
+  os.utime(entry)
+  return True
+
+# Save outputs for a key and remove the oldest entries
+def store(key, output_paths):
+  entry = os.path.join(CACHE_DIR, key)
+  os.makedirs(entry, exist_ok=True)
+  for path in output_paths:
+    shutil.copyfile(path, os.path.join(entry, os.path.basename(path)))
+
+  entries = sorted(glob.glob(os.path.join(CACHE_DIR, '*')), key=os.path.getmtime)
+  for old_entry in entries[:-CACHE_MAX_ENTRIES]:
+    shutil.rmtree(old_entry, ignore_errors=True)
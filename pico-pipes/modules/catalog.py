@@ -0,0 +1,157 @@
+import os
+import sqlite3
+
+# Catalog of MIDI files and their tracks, in the CWD next to the compile cache
+CATALOG_PATH = './.midi-catalog.sqlite'
+# Bumped when the stored columns change, so old catalogs are rebuilt
+SCHEMA_VERSION = 1
+SCHEMA = '''
+  CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    duration REAL NOT NULL,
+    error TEXT
+  );
+  CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    track INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    program INTEGER NOT NULL,
+    program_name TEXT NOT NULL,
+    notes INTEGER NOT NULL,
+    pitch_min INTEGER,
+    pitch_max INTEGER,
+    duration REAL NOT NULL,
+    max_polyphony INTEGER NOT NULL,
+    PRIMARY KEY (path, track)
+  );
+  CREATE INDEX IF NOT EXISTS tracks_program ON tracks(program);
+  CREATE INDEX IF NOT EXISTS tracks_notes ON tracks(notes);
+'''
+# Columns of a track, in the order they are stored after the path
+TRACK_COLUMNS = ['track', 'summary', 'program', 'program_name', 'notes', 'pitch_min', 'pitch_max', 'duration', 'max_polyphony']
+
+# Open (or create) a catalog
+def connect(path=CATALOG_PATH):
+  db = sqlite3.connect(path)
+  db.row_factory = sqlite3.Row
+  db.execute('PRAGMA foreign_keys = ON')
+  if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+    db.executescript('DROP TABLE IF EXISTS tracks; DROP TABLE IF EXISTS files;')
+    db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+  db.executescript(SCHEMA)
+  return db
+
+# Key a file is stored under, so the same file is found from any relative path
+def file_key(path):
+  return os.path.abspath(path)
+
+# Whether a file's catalog entry was made from its current content, judged by
+# modification time and size alone
+def is_current(db, path):
+  stat = os.stat(path)
+  row = db.execute('SELECT mtime_ns, size FROM files WHERE path = ?', (file_key(path),)).fetchone()
+  return row is not None and (row['mtime_ns'], row['size']) == (stat.st_mtime_ns, stat.st_size)
+
+# Files of a list that need describing: new, or changed in time or size and
+# content. Files with only a new modification time are updated in place.
+def changed_files(db, paths, hash_file):
+  changed = []
+  for path in paths:
+    if is_current(db, path):
+      continue
+    stat = os.stat(path)
+    digest = hash_file(path)
+    row = db.execute('SELECT hash FROM files WHERE path = ?', (file_key(path),)).fetchone()
+    if row is not None and row['hash'] == digest:
+      db.execute('UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?', (stat.st_mtime_ns, stat.st_size, file_key(path)))
+      continue
+    changed.append((path, digest))
+  db.commit()
+  return changed
+
+# Store a file's tracks, given as dicts of TRACK_COLUMNS, or the error that
+# stopped it being read so it isn't read again until it changes
+def store(db, path, digest, tracks, error=None):
+  stat = os.stat(path)
+  key = file_key(path)
+  duration = max([track['duration'] for track in tracks] + [0.0])
+  db.execute('DELETE FROM files WHERE path = ?', (key,))
+  db.execute(
+    'INSERT INTO files (path, mtime_ns, size, hash, duration, error) VALUES (?, ?, ?, ?, ?, ?)',
+    (key, stat.st_mtime_ns, stat.st_size, digest, duration, error)
+  )
+  db.executemany(
+    f"INSERT INTO tracks (path, {', '.join(TRACK_COLUMNS)}) VALUES (?{', ?' * len(TRACK_COLUMNS)})",
+    [(key, *[track[column] for column in TRACK_COLUMNS]) for track in tracks]
+  )
+  db.commit()
+
+# Remove files in a directory that are no longer there, or no longer listed
+def prune(db, dir, paths):
+  kept = {file_key(path) for path in paths}
+  prefix = os.path.join(file_key(dir), '')
+  stored = db.execute("SELECT path FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)).fetchall()
+  removed = [row['path'] for row in stored if row['path'] not in kept and os.path.dirname(row['path']) == file_key(dir)]
+  db.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in removed])
+  db.commit()
+  return len(removed)
+
+# Catalogued tracks of one file, or None if it isn't catalogued, has changed
+# or could not be read, so callers read it themselves and see why
+def lookup(db, path):
+  if not is_current(db, path):
+    return None
+  row = db.execute('SELECT error FROM files WHERE path = ?', (file_key(path),)).fetchone()
+  if row['error'] is not None:
+    return None
+  return db.execute('SELECT * FROM tracks WHERE path = ? ORDER BY track', (file_key(path),)).fetchall()
+
+# Tracks matching all the given filters, by file then track. Text filters
+# match any part of the file or program name, ignoring case.
+def search(db, name=None, program=None, min_notes=None, max_polyphony=None, min_pitch=None, max_pitch=None):
+  where = []
+  params = []
+  if name:
+    where.append("tracks.path LIKE ?")
+    params.append(f"%{name}%")
+  if program:
+    where.append("tracks.program_name LIKE ?")
+    params.append(f"%{program}%")
+  if min_notes is not None:
+    where.append('tracks.notes >= ?')
+    params.append(min_notes)
+  if max_polyphony is not None:
+    where.append('tracks.max_polyphony <= ?')
+    params.append(max_polyphony)
+  if min_pitch is not None:
+    where.append('tracks.pitch_min >= ?')
+    params.append(min_pitch)
+  if max_pitch is not None:
+    where.append('tracks.pitch_max <= ?')
+    params.append(max_pitch)
+
+  query = 'SELECT tracks.* FROM tracks'
+  if where:
+    query += ' WHERE ' + ' AND '.join(where)
+  return db.execute(query + ' ORDER BY tracks.path, tracks.track', params).fetchall()
+
+# Files that could not be read when catalogued, optionally only those whose
+# path contains some text
+def errors(db, name=None):
+  return db.execute(
+    'SELECT path, error FROM files WHERE error IS NOT NULL AND path LIKE ? ORDER BY path',
+    (f"%{name or ''}%",)
+  ).fetchall()
+
+# Print catalogued tracks grouped by file
+def print_tracks(rows):
+  path = None
+  for row in rows:
+    if row['path'] != path:
+      path = row['path']
+      print(f"\n{os.path.relpath(path)}")
+    pitches = f"{row['pitch_min']}-{row['pitch_max']}" if row['notes'] else '-'
+    print(f"  {row['track']}: {row['summary']}, range {pitches}, polyphony {row['max_polyphony']}, {row['duration']:.1f}s")
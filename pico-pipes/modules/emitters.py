@@ -0,0 +1,452 @@
+import concurrent.futures
+import filecmp
+import itertools
+import json
+import os
+
+from modules import packed, phrases, ticks, uf2, varint
+
+# Bytes buffered per output file before hitting the disk
+WRITE_BUFFER = 1 << 16
+# Notes handed to writer threads at a time
+THREAD_CHUNK = 4096
+
+# Hidden file next to an output that it is written to first, so a build never
+# reads a half-written output
+def temp_path(path):
+  directory, name = os.path.split(path)
+  return os.path.join(directory, f".{name}.tmp")
+
+# Move a finished temp file over its output in one step. An output that already
+# has the same content is left untouched, so make has nothing to rebuild.
+def replace_if_changed(temp, path):
+  if os.path.exists(path) and filecmp.cmp(temp, path, shallow=False):
+    os.remove(temp)
+  else:
+    os.replace(temp, path)
+
+# Base output file - subclasses write the header, one row per note, and footer.
+# Rows are given times in whole ticks of ticks.TICK_US.
+class Emitter:
+  # Kind of table written, for sizes in modules/fit.py
+  kind = None
+
+  def __init__(self, path, limit=None, binary=False):
+    self.path = path
+    self.limit = limit
+    self.binary = binary
+    self.file = None
+    self.count = 0
+    self.size = 0
+
+  # Open the file and write the header for a timeline of num_notes
+  def open(self, num_notes):
+    self.count = num_notes if self.limit is None else min(num_notes, self.limit)
+    mode = 'wb' if self.binary else 'w'
+    newline = None if self.binary else ''
+    self.file = open(temp_path(self.path), mode, buffering=WRITE_BUFFER, newline=newline)
+    self.begin()
+
+  # Every file written, for caching
+  def paths(self):
+    return [self.path]
+
+  # Write the footer and close the file, keeping its size. Outputs are only
+  # put in place by commit(), once every output of a song has been finished.
+  def finish(self):
+    self.end()
+    self.size = self.file.tell()
+    self.file.close()
+
+  # Move each finished file over its output
+  def commit(self):
+    for path in self.paths():
+      replace_if_changed(temp_path(path), path)
+
+  # Close the file after an error, leaving the outputs as they were
+  def abort(self):
+    if self.file is not None:
+      self.file.close()
+    for path in self.paths():
+      if os.path.exists(temp_path(path)):
+        os.remove(temp_path(path))
+
+  def begin(self):
+    pass
+
+  def row(self, track, pitch, on, off):
+    pass
+
+  def end(self):
+    pass
+
+# Pico C header of float rows
+class PicoEmitter(Emitter):
+  kind = 'float'
+
+  def begin(self):
+    self.file.write('// GENERATED WITH pico-pipes/compile.py\n\n')
+    self.file.write(f"#define NUM_NOTES {self.count}\n\n")
+    self.file.write('// Order is track, pitch, on_at, off_at\n')
+    self.file.write('static const float* NOTE_TABLE[] = {\n')
+
+  def row(self, track, pitch, on, off):
+    self.file.write(f"  (float[]){{ {track}, {pitch}, {ticks.format_seconds(on)}, {ticks.format_seconds(off)} }},\n")
+
+  def end(self):
+    self.file.write('};\n')
+
+# Pico C header of packed integer millisecond rows
+class PackedPicoEmitter(Emitter):
+  kind = 'packed'
+
+  def begin(self):
+    self.file.write('// GENERATED WITH pico-pipes/compile.py\n\n')
+    self.file.write(f"#define NUM_NOTES {self.count}\n")
+    self.file.write('#define NOTE_TABLE_PACKED 1\n\n')
+    self.file.write('// Order is track, pitch, on_ms, off_ms\n')
+    self.file.write('static const struct PackedNote NOTE_TABLE[] = {\n')
+
+  def row(self, track, pitch, on, off):
+    self.file.write(f"  {{ {track}, {pitch}, {ticks.to_ms(on)}, {ticks.to_ms(off)} }},\n")
+
+  def end(self):
+    self.file.write('};\n')
+
+# Raw packed blob with the same layout as the packed Pico header
+class PackedBinEmitter(Emitter):
+  kind = 'packed'
+
+  def __init__(self, path, limit=None):
+    super().__init__(path, limit, binary=True)
+
+  def row(self, track, pitch, on, off):
+    self.file.write(pack_row(track, pitch, on, off))
+
+  def end(self):
+    # Blob must decode back to exactly one record per note
+    if self.file.tell() != self.count * packed.RECORD_SIZE:
+      raise ValueError(f"{self.path} does not hold {self.count} packed notes")
+
+# Pico C header of integer rows with precomputed step delays and durations
+class TimedPicoEmitter(Emitter):
+  kind = 'timed'
+
+  def __init__(self, path, step_delays, limit=None):
+    super().__init__(path, limit)
+    self.step_delays = step_delays
+
+  def begin(self):
+    self.file.write('// GENERATED WITH pico-pipes/compile.py\n\n')
+    self.file.write(f"#define NUM_NOTES {self.count}\n")
+    self.file.write('#define NOTE_TABLE_TIMED 1\n\n')
+    self.file.write('// Order is track, pitch, on_ms, duration_us, step_delay_us\n')
+    self.file.write('static const struct TimedNote NOTE_TABLE[] = {\n')
+
+  def row(self, track, pitch, on, off):
+    duration_us = to_duration_us(on, off)
+    step_delay_us = self.step_delays[track][pitch]
+    self.file.write(f"  {{ {track}, {pitch}, {ticks.to_ms(on)}, {duration_us}, {step_delay_us} }},\n")
+
+  def end(self):
+    self.file.write('};\n')
+
+# Raw blob with the same layout as the timed Pico header
+class TimedBinEmitter(Emitter):
+  kind = 'timed'
+
+  def __init__(self, path, step_delays, limit=None):
+    super().__init__(path, limit, binary=True)
+    self.step_delays = step_delays
+
+  def row(self, track, pitch, on, off):
+    self.file.write(pack_row(track, pitch, on, off, self.step_delays))
+
+# C header of a varint note stream, read with note_stream.h
+class VarintHeaderEmitter(Emitter):
+  kind = 'varint'
+
+  def __init__(self, path, limit=None, tick_us=varint.TICK_US):
+    super().__init__(path, limit)
+    self.encoder = varint.Encoder(tick_us)
+
+  def begin(self):
+    self.file.write('// GENERATED WITH pico-pipes/compile.py\n\n')
+    self.file.write(f"#define NUM_NOTES {self.count}\n")
+    self.file.write(f"#define NOTE_STREAM_TICK_US {self.encoder.tick_us}\n\n")
+    self.file.write('// Varint note stream, decode with note_stream.h\n')
+    self.file.write('static const uint8_t NOTE_STREAM[] = {\n')
+    self.write_bytes(self.encoder.header(self.count))
+
+  def row(self, track, pitch, on, off):
+    self.write_bytes(encode_ticks(self.encoder, track, pitch, on, off))
+
+  def end(self):
+    self.file.write('};\n')
+
+  def write_bytes(self, data):
+    self.file.write(f"  {', '.join(map(str, data))},\n")
+
+# Raw varint note stream
+class VarintBinEmitter(Emitter):
+  kind = 'varint'
+
+  def __init__(self, path, limit=None, tick_us=varint.TICK_US):
+    super().__init__(path, limit, binary=True)
+    self.encoder = varint.Encoder(tick_us)
+
+  def begin(self):
+    self.file.write(self.encoder.header(self.count))
+
+  def row(self, track, pitch, on, off):
+    self.file.write(encode_ticks(self.encoder, track, pitch, on, off))
+
+# Python module of list rows for thumby-dev/midi-player
+class ThumbyEmitter(Emitter):
+  kind = 'thumby'
+
+  def __init__(self, path, file_name, limit=None):
+    super().__init__(path, limit)
+    self.file_name = file_name
+
+  def begin(self):
+    self.file.write('# GENERATED WITH pico-pipes/compile.py\n\n')
+    self.file.write(f"FILE_NAME = '{self.file_name.split('/')[-1]}'\n\n")
+    self.file.write('# Order is track, pitch, on_at, off_at\n')
+    self.file.write('TRACK = [\n')
+
+  def row(self, track, pitch, on, off):
+    self.file.write(f"  [{track}, {pitch}, {ticks.format_seconds(on)}, {ticks.format_seconds(off)} ],\n")
+
+  def end(self):
+    self.file.write(']\n')
+
+# MicroPython module that reads notes one at a time from a Thumby .bin file
+THUMBY_READER = """# GENERATED WITH pico-pipes/compile.py
+
+import struct
+
+FILE_NAME = '{file_name}'
+NOTES_FILE = '{notes_file}'
+NUM_NOTES = {num_notes}
+
+# Order is track, pitch, on_ms, off_ms
+RECORD_FORMAT = '{record_format}'
+RECORD_SIZE = {record_size}
+
+# Yield (track, pitch, on_at, off_at) rows like TRACK, times in seconds. Only
+# one record is in memory at a time. Pass the path of NOTES_FILE if it isn't
+# in the working directory.
+def notes(path=NOTES_FILE):
+  record = bytearray(RECORD_SIZE)
+  with open(path, 'rb') as file:
+    for _ in range(NUM_NOTES):
+      file.readinto(record)
+      track, pitch, on_ms, off_ms = struct.unpack(RECORD_FORMAT, record)
+      yield track, pitch, on_ms / 1000, off_ms / 1000
+"""
+
+# Thumby notes as a packed .bin file, plus a reader module next to it, so songs
+# of any length play in constant memory
+class ThumbyBinEmitter(Emitter):
+  kind = 'thumby-bin'
+
+  def __init__(self, path, reader_path, file_name, limit=None):
+    super().__init__(path, limit, binary=True)
+    self.reader_path = reader_path
+    self.file_name = file_name
+
+  def paths(self):
+    return [self.path, self.reader_path]
+
+  def row(self, track, pitch, on, off):
+    self.file.write(packed.THUMBY_RECORD.pack(track, pitch, ticks.to_ms(on), ticks.to_ms(off)))
+
+  def end(self):
+    with open(temp_path(self.reader_path), 'w', newline='') as file:
+      file.write(THUMBY_READER.format(
+        file_name=self.file_name.split('/')[-1],
+        notes_file=os.path.basename(self.path),
+        num_notes=self.count,
+        record_format=packed.THUMBY_RECORD.format,
+        record_size=packed.THUMBY_RECORD.size,
+      ))
+
+# C header of int rows for pebble-dev/watchapps/midi-player
+class PebbleEmitter(Emitter):
+  kind = 'pebble'
+
+  def begin(self):
+    self.file.write('// GENERATED WITH pico-pipes/compile.py\n\n')
+    self.file.write(f"#define NUM_NOTES {self.count}\n\n")
+    self.file.write('// Order is track, pitch, on_at, off_at\n')
+    self.file.write('static const int* NOTE_TABLE[] = {\n')
+
+  def row(self, track, pitch, on, off):
+    self.file.write(f"  (int[]){{ {track}, {pitch}, {ticks.to_ms(on)}, {ticks.to_ms(off)} }},\n")
+
+  def end(self):
+    self.file.write('};\n')
+
+# Duration of a note in microseconds from its times in ticks, zero if reversed
+def to_duration_us(on, off):
+  return max(off - on, 0) * ticks.TICK_US
+
+# Varint stream bytes of a note with times in ticks, rounded to the stream's
+# own ticks from the absolute times
+def encode_ticks(encoder, track, pitch, on, off):
+  return encoder.note_ticks(track, pitch, ticks.convert(on, encoder.tick_us), ticks.convert(off, encoder.tick_us))
+
+# Packed record of a note, or with step delays a timed one, as in .bin files.
+# Times are in ticks.
+def pack_row(track, pitch, on, off, step_delays=None):
+  if step_delays is None:
+    return packed.RECORD.pack(track, pitch, ticks.to_ms(on), ticks.to_ms(off))
+  return packed.TIMED_RECORD.pack(track, pitch, ticks.to_ms(on), to_duration_us(on, off), step_delays[track][pitch])
+
+# UF2 image of a packed (or with step delays, timed) note table in the flash
+# region read by firmware built with NOTE_TABLE_FLASH. With a prebuilt firmware
+# UF2, the table is patched into it so one file flashes both.
+class Uf2Emitter(Emitter):
+  def __init__(self, path, step_delays=None, firmware=None, limit=None):
+    super().__init__(path, limit, binary=True)
+    self.step_delays = step_delays
+    self.firmware = firmware
+    self.kind = 'packed' if step_delays is None else 'timed'
+    self.rows = bytearray()
+
+  def row(self, track, pitch, on, off):
+    self.rows += pack_row(track, pitch, on, off, self.step_delays)
+
+  def end(self):
+    kind = uf2.KIND_PACKED if self.step_delays is None else uf2.KIND_TIMED
+    data = uf2.region(kind, self.count, bytes(self.rows))
+    if self.firmware is None:
+      self.file.write(uf2.region_image(data))
+      return
+
+    with open(self.firmware, 'rb') as file:
+      self.file.write(uf2.patch(file.read(), data))
+
+# Phrase table, storing each repeated run of notes once, for targets short on
+# memory. Needs the whole song, so rows are kept until the end.
+class PhraseEmitter(Emitter):
+  kind = 'phrases'
+
+  def __init__(self, path, limit=None):
+    super().__init__(path, limit, binary=True)
+    self.rows = []
+
+  def row(self, track, pitch, on, off):
+    self.rows.append((track, pitch, ticks.to_ms(on), ticks.to_ms(off)))
+
+  def end(self):
+    self.file.write(phrases.encode(*phrases.compress(self.rows)))
+
+# JSON document of list rows, for tools outside this repo
+class JsonEmitter(Emitter):
+  kind = 'json'
+
+  def __init__(self, path, file_name, limit=None):
+    super().__init__(path, limit)
+    self.file_name = file_name
+    self.rows = 0
+
+  def begin(self):
+    self.file.write('{\n')
+    self.file.write(f"  \"file_name\": {json.dumps(self.file_name.split('/')[-1])},\n")
+    self.file.write(f"  \"num_notes\": {self.count},\n")
+    self.file.write('  "order": ["track", "pitch", "on_at", "off_at"],\n')
+    self.file.write('  "notes": [')
+
+  def row(self, track, pitch, on, off):
+    self.file.write(f"{',' if self.rows else ''}\n    [{track}, {pitch}, {ticks.format_seconds(on)}, {ticks.format_seconds(off)}]")
+    self.rows += 1
+
+  def end(self):
+    self.file.write('\n  ]\n}\n')
+
+# A kind of output file that can be chosen with --targets: its file suffix,
+# note limit, and a function make(path, limit, options) that returns its
+# emitter, or None if the table options don't call for the file
+class Target:
+  def __init__(self, suffix, make, limit=None, description=''):
+    self.suffix = suffix
+    self.make = make
+    self.limit = limit
+    self.description = description
+
+# Write rows of a timeline to opened emitters, rounding times to ticks once for
+# them all
+def write_rows(timeline, emitters):
+  # Smallest limit last, so one check per note finds emitters that are done
+  active = sorted(emitters, key=lambda emitter: emitter.count, reverse=True)
+  for index, (track, pitch, on, off) in enumerate(timeline.tick_rows()):
+    while active and active[-1].count <= index:
+      active.pop()
+    if not active:
+      break
+
+    for emitter in active:
+      emitter.row(track, pitch, on, off)
+
+# Write rows of a timeline to opened emitters from a pool of threads. Rows are
+# still made and rounded to ticks once, THREAD_CHUNK at a time, and each
+# emitter writes a chunk in its own thread while the next chunk is made.
+def write_rows_threaded(timeline, emitters, pool):
+  rows = timeline.tick_rows()
+  start = 0
+  pending = []
+  while True:
+    chunk = list(itertools.islice(rows, THREAD_CHUNK))
+    # Each emitter writes its chunks in order
+    for future in pending:
+      future.result()
+    pending = [
+      pool.submit(write_chunk, emitter, chunk[:emitter.count - start])
+      for emitter in emitters if emitter.count > start
+    ]
+    if not chunk or not pending:
+      break
+    start += len(chunk)
+
+# Write a chunk of rows to one emitter
+def write_chunk(emitter, rows):
+  for track, pitch, on, off in rows:
+    emitter.row(track, pitch, on, off)
+
+# Stream each note of a NoteTimeline into every emitter's temp file. With more
+# than one thread, emitters write in threads of their own so one file's disk
+# writes overlap formatting the rows of others. An error in any removes
+# all their temp files. Nothing replaces an output until commit(), so a caller
+# can finish every output of a song first and leave them all as they were if
+# any fails.
+def emit(timeline, emitters, verbose=True, threads=1):
+  try:
+    for emitter in emitters:
+      emitter.open(len(timeline))
+      if verbose and emitter.count < len(timeline):
+        print(f"WARNING: Trimming {emitter.path} to recommended maximum of {emitter.count} notes")
+
+    if threads > 1 and len(emitters) > 1:
+      with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        write_rows_threaded(timeline, emitters, pool)
+    else:
+      write_rows(timeline, emitters)
+    for emitter in emitters:
+      emitter.finish()
+  except BaseException:
+    abort(emitters)
+    raise
+
+# Move the finished files of every emitter over their outputs
+def commit(emitters, verbose=True):
+  for emitter in emitters:
+    emitter.commit()
+    if verbose:
+      print(f"Wrote {emitter.path} ({emitter.size} bytes)")
+
+# Remove the temp files of emitters whose outputs are to be left as they were
+def abort(emitters):
+  for emitter in emitters:
+    emitter.abort()
@@ -0,0 +1,160 @@
+import numpy as np
+
+from modules import ticks, varint
+from modules.timeline import NoteTimeline
+
+# Bytes one note takes in each kind of table once compiled for its target.
+# Pointer tables hold a 4 byte pointer plus four 4 byte values per note. Thumby
+# lists are only budgeted by note count, JSON isn't stored on a target, and
+# phrase tables depend on how much of the song repeats.
+NOTE_BYTES = {
+  'float': 20,
+  'packed': 12,
+  'timed': 16,
+  'pebble': 20,
+  'thumby': None,
+  'thumby-bin': 10,
+  'json': None,
+  'phrases': None,
+}
+# Varint stream tick lengths to try before dropping notes, up to 10ms of timing
+# error which is still hard to hear
+TICK_STEPS_US = [1000, 2000, 5000, 10000]
+
+# Bytes taken by an unsigned varint
+def varint_size(value):
+  return max((value.bit_length() + 6) // 7, 1)
+
+# Bytes taken by each of an array of unsigned varints
+def varint_sizes(values):
+  sizes = np.ones(len(values), dtype=np.int64)
+  for shift in range(7, 64, 7):
+    sizes += values >= (1 << shift)
+  return sizes
+
+# Size of each note in a table of some kind, in bytes. For varint streams this
+# follows varint.Encoder, from the same ticks emitters round times to.
+def note_sizes(timeline, kind, tick_us=varint.TICK_US):
+  if kind != 'varint':
+    return np.full(len(timeline), NOTE_BYTES[kind], dtype=np.int64)
+
+  on = ticks.convert(ticks.to_ticks(timeline.on), tick_us)
+  off = ticks.convert(ticks.to_ticks(timeline.off), tick_us)
+  deltas = np.diff(on, prepend=0)
+  durations = np.maximum(off - on, 0)
+  tags = (timeline.pitches.astype(np.int64) << 4) | timeline.tracks
+  return varint_sizes(deltas) + varint_sizes(durations) + varint_sizes(tags)
+
+# Bytes of a table before its first note
+def header_size(kind, num_notes, tick_us=varint.TICK_US):
+  return varint_size(num_notes) + varint_size(tick_us) if kind == 'varint' else 0
+
+# Exact size of a timeline as a table of some kind, without writing it
+def table_size(timeline, kind, tick_us=varint.TICK_US):
+  return header_size(kind, len(timeline), tick_us) + int(note_sizes(timeline, kind, tick_us).sum())
+
+# Most notes from the start of a timeline that fit the budgets
+def fitting_count(timeline, kind, max_notes=None, max_bytes=None, tick_us=varint.TICK_US):
+  count = len(timeline) if max_notes is None else min(len(timeline), max_notes)
+  if max_bytes is None or NOTE_BYTES.get(kind, 0) is None:
+    return count
+
+  # Header of the whole timeline is never smaller than that of a prefix
+  room = max_bytes - header_size(kind, len(timeline), tick_us)
+  total = np.cumsum(note_sizes(timeline.head(count), kind, tick_us))
+  return min(count, int(np.searchsorted(total, room, side='right')))
+
+# Drop notes that repeat the pitch and on time of an earlier one, keeping the
+# note of the earliest track
+def dedupe(timeline):
+  notes = timeline.notes
+  key = ticks.to_ticks(notes['on']) * 256 + notes['pitch']
+  order = np.lexsort((notes['track'], key))
+  first = np.ones(len(order), dtype=bool)
+  first[1:] = key[order][1:] != key[order][:-1]
+  keep = np.sort(order[first])
+  return NoteTimeline(notes[keep], timeline.file_name, timeline.summaries)
+
+# Fit a timeline into a target's note and/or byte budget, returning the new
+# timeline, the varint tick length to use and a report. In order, until the
+# whole song fits:
+#   1. Duplicate notes are removed
+#   2. Varint streams use coarser ticks
+#   3. Tracks are dropped from the last, which is the lowest priority, as long
+#      as that keeps more of the song's length
+#   4. The song is cut after the last note that fits
+def fit(timeline, kind, max_notes=None, max_bytes=None):
+  original = timeline
+  timeline = dedupe(timeline)
+  duplicates = len(original) - len(timeline)
+
+  tick_us = varint.TICK_US
+  if kind == 'varint' and max_bytes is not None:
+    for tick_us in TICK_STEPS_US:
+      if fitting_count(timeline, kind, max_notes, max_bytes, tick_us) == len(timeline):
+        break
+
+  # Fewer tracks play for longer in the same space
+  best = None
+  num_tracks = int(timeline.tracks.max()) + 1 if len(timeline) else 1
+  for kept_tracks in range(num_tracks, 0, -1):
+    candidate = NoteTimeline(timeline.notes[timeline.tracks < kept_tracks], timeline.file_name, timeline.summaries)
+    count = fitting_count(candidate, kind, max_notes, max_bytes, tick_us)
+    length = candidate.head(count).duration()
+    if best is None or length > best[2]:
+      best = (candidate, count, length, kept_tracks)
+    if count == len(candidate):
+      break
+
+  candidate, count, _, kept_tracks = best
+
+  # Fewer tracks may not need ticks as coarse to keep the same notes
+  if kind == 'varint' and max_bytes is not None:
+    for tick_us in TICK_STEPS_US:
+      if fitting_count(candidate, kind, max_notes, max_bytes, tick_us) >= count:
+        break
+    # and may keep more notes than the tick they were chosen with
+    count = fitting_count(candidate, kind, max_notes, max_bytes, tick_us)
+  dropped_tracks = list(range(num_tracks - 1, kept_tracks - 1, -1))
+  cut = len(candidate) - count
+  timeline = candidate.head(count)
+
+  duration = original.duration()
+  report = {
+    'kind': kind,
+    'max_notes': max_notes,
+    'max_bytes': max_bytes,
+    'notes': len(original),
+    'kept_notes': len(timeline),
+    'duplicates': duplicates,
+    'tick_us': tick_us,
+    'dropped_tracks': dropped_tracks,
+    'cut_notes': cut,
+    'bytes': table_size(timeline, kind, tick_us) if NOTE_BYTES.get(kind, 0) is not None else None,
+    'kept_duration': timeline.duration() / duration if duration > 0 else 1.0,
+  }
+  return timeline, tick_us, report
+
+# Print a fit report for one output file
+def print_report(path, report, summaries):
+  budget = []
+  if report['max_notes'] is not None:
+    budget.append(f"{report['max_notes']} notes")
+  # Tables with no size per note, like Thumby lists, can't be fitted to bytes
+  sized = report['bytes'] is not None
+  if report['max_bytes'] is not None and sized:
+    budget.append(f"{report['max_bytes']} bytes")
+  size = f", {report['bytes']} bytes" if sized else ''
+  print(f"\nfit {path} to {' and '.join(budget)}: kept {report['kept_notes']}/{report['notes']} notes{size}, "
+    f"{report['kept_duration'] * 100:.0f}% of the song's length")
+  if report['max_bytes'] is not None and not sized:
+    print(f"  WARNING: {report['kind']} tables have no byte size, so only the note limit applies")
+  if report['duplicates']:
+    print(f"  removed {report['duplicates']} duplicate notes")
+  if report['tick_us'] != varint.TICK_US:
+    print(f"  used {report['tick_us']}us ticks")
+  for track in report['dropped_tracks']:
+    name = summaries[track] if track < len(summaries) else f"Track {track}"
+    print(f"  dropped {name}")
+  if report['cut_notes']:
+    print(f"  cut the last {report['cut_notes']} notes")
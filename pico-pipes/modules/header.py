@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+
+from modules import packed, varint
+from modules.timeline import NOTE_DTYPE, NoteTimeline
+
+# File extensions of tables written by compile.py that can be read back
+HEADER_EXTENSIONS = ['.h', '.py']
+
+# Kind of table from its declaration line and #defines
+def table_kind(line, defines):
+  if 'NOTE_STREAM[]' in line:
+    return 'stream'
+  if 'NOTE_TABLE_TIMED' in defines:
+    return 'timed'
+  if 'NOTE_TABLE_PACKED' in defines:
+    return 'packed'
+  if 'int*' in line:
+    return 'pebble'
+  return 'float'
+
+# Read the values of every table row and the kind of table, one line at a time.
+# Each row is on its own line, between braces (C) or brackets (Thumby), after
+# any cast.
+def read_rows(file):
+  values = []
+  defines = set()
+  kind = None
+
+  for line in file:
+    if kind is None:
+      if line.startswith('#define'):
+        defines.add(line.split()[1])
+      elif 'NOTE_TABLE[]' in line or 'NOTE_STREAM[]' in line or line.startswith('TRACK ='):
+        kind = table_kind(line, defines)
+      elif line.startswith('NOTES_FILE ='):
+        # Thumby reader module, the notes are in the .bin file it names
+        return [line.split('=')[1].strip().strip("'")], 'thumby-bin'
+      continue
+
+    line = line.strip()
+    if line.startswith(('}', ']')):
+      break
+    if not line:
+      continue
+
+    if kind == 'stream':
+      values += line.rstrip(',').split(',')
+      continue
+
+    # Start after the last opening brace or bracket, which skips '(float[])'
+    start = max(line.rfind('{'), line.rfind('['))
+    end = line.find('}' if line[start] == '{' else ']', start)
+    values += line[start + 1:end].split(',')
+
+  if kind is None:
+    raise ValueError('No NOTE_TABLE, NOTE_STREAM or TRACK table found')
+  return values, kind
+
+# Read a note table written by compile.py back into a NoteTimeline
+def read_header(path):
+  with open(path) as file:
+    values, kind = read_rows(file)
+
+  if kind == 'thumby-bin':
+    rows = np.array(packed.read_bin(os.path.join(os.path.dirname(path), values[0]), packed.THUMBY_RECORD), dtype=np.float64).reshape(-1, 4)
+  elif kind == 'stream':
+    blob = bytes(int(value) for value in values)
+    rows = np.array(varint.decode(blob), dtype=np.float64).reshape(-1, 4)
+  else:
+    rows = np.array(values, dtype=np.float64).reshape(-1, 5 if kind == 'timed' else 4)
+
+  notes = np.zeros(len(rows), dtype=NOTE_DTYPE)
+  notes['track'] = rows[:, 0]
+  notes['pitch'] = rows[:, 1]
+  if kind == 'timed':
+    # on_ms, duration_us, step_delay_us
+    notes['on'] = rows[:, 2] / 1000
+    notes['off'] = notes['on'] + rows[:, 3] / 1000000
+  elif kind in ['packed', 'pebble', 'thumby-bin']:
+    # Milliseconds
+    notes['on'] = rows[:, 2] / 1000
+    notes['off'] = rows[:, 3] / 1000
+  else:
+    notes['on'] = rows[:, 2]
+    notes['off'] = rows[:, 3]
+
+  num_tracks = int(notes['track'].max()) + 1 if len(notes) else 0
+  summaries = [f"Track {track}" for track in range(num_tracks)]
+  return NoteTimeline(notes, os.path.basename(path), summaries)
+
+# Whether a path looks like a table written by compile.py rather than a MIDI file
+def is_header(path):
+  return os.path.splitext(path)[1].lower() in HEADER_EXTENSIONS
@@ -0,0 +1,57 @@
+import numpy as np
+
+from modules.timeline import NoteTimeline
+
+# Clean up a timeline, returning the new timeline and a report of what was
+# removed:
+#   - notes that end when (or before) they start
+#   - exact copies of another note on the same track
+#   - same track, same pitch notes that overlap, merged into one note from the
+#     first start to the last end, which saves motor_set_note() calls for notes
+#     that would only restart the same pitch
+# Notes that merely touch are kept apart. Sorts, so O(n log n).
+def normalize(timeline):
+  notes = timeline.notes
+  report = {'notes': len(notes)}
+
+  playable = notes['off'] > notes['on']
+  report['zero_length'] = int((~playable).sum())
+  index = np.flatnonzero(playable)
+  notes = notes[index]
+
+  # Group by track and pitch, in order of start then end within each group
+  group = notes['track'].astype(np.int32) * 256 + notes['pitch']
+  order = np.lexsort((notes['off'], notes['on'], group))
+  group = group[order]
+  on = notes['on'][order]
+  off = notes['off'][order]
+
+  new_group = np.ones(len(order), dtype=bool)
+  new_group[1:] = group[1:] != group[:-1]
+  duplicate = ~new_group
+  duplicate[1:] &= (on[1:] == on[:-1]) & (off[1:] == off[:-1])
+  report['duplicates'] = int(duplicate.sum())
+
+  # A note starts a new run unless it starts before the latest end so far in
+  # its group. There are at most a few thousand groups.
+  bounds = np.append(np.flatnonzero(new_group), len(order))
+  latest_off = np.empty_like(off)
+  for start, end in zip(bounds[:-1], bounds[1:]):
+    latest_off[start:end] = np.maximum.accumulate(off[start:end])
+  starts = new_group.copy()
+  starts[1:] |= on[1:] >= latest_off[:-1]
+  first = np.flatnonzero(starts)
+  report['merged'] = len(order) - len(first) - report['duplicates']
+
+  merged = notes[order[first]]
+  if len(first):
+    merged['off'] = np.maximum.reduceat(off, first)
+
+  # Back in the original order, which was by start time
+  merged = merged[np.argsort(index[order[first]], kind='stable')]
+  return NoteTimeline(merged, timeline.file_name, timeline.summaries), report
+
+# Print a normalization report
+def print_report(report):
+  print(f"\nnormalize: {report['notes']} notes, removed {report['zero_length']} zero length, "
+    f"{report['duplicates']} duplicates, merged {report['merged']} overlaps")
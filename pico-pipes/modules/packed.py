@@ -0,0 +1,30 @@
+import struct
+import sys
+
+# Little-endian record matching 'struct PackedNote' in main.h (2 bytes padding)
+RECORD = struct.Struct('<BBxxII')
+# Size of one packed note in bytes
+RECORD_SIZE = RECORD.size
+# Record matching 'struct TimedNote' - track, pitch, on_ms, duration_us, step_delay_us
+TIMED_RECORD = struct.Struct('<BBxxIII')
+# Record of Thumby .bin files - track, pitch, on_ms, off_ms with no padding,
+# since MicroPython's struct has no 'x'
+THUMBY_RECORD = struct.Struct('<BBII')
+
+# Unpack a blob back into a list of notes, (track, pitch, on_ms, off_ms) by default
+def decode(blob, record=RECORD):
+  if len(blob) % record.size != 0:
+    raise ValueError(f"Blob size {len(blob)} is not a multiple of {record.size}")
+  return list(record.iter_unpack(blob))
+
+# Read a .bin file written by compile.py
+def read_bin(path, record=RECORD):
+  with open(path, 'rb') as file:
+    return decode(file.read(), record)
+
+if '__main__' in __name__:
+  # --timed reads tables written with compile.py --step-delays, --thumby the
+  # thumby-bin target
+  record = TIMED_RECORD if '--timed' in sys.argv else THUMBY_RECORD if '--thumby' in sys.argv else RECORD
+  for note in read_bin(sys.argv[1], record):
+    print(note)
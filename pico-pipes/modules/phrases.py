@@ -0,0 +1,164 @@
+import struct
+import sys
+
+# Songs often repeat whole sections, so instead of one row per note a phrase
+# table stores each run of notes once and plays it again wherever it repeats:
+#   header:  num_notes (once expanded), num_phrases, num_phrase_notes, num_calls
+#   notes:   pitch, gap from the previous note of the phrase and duration, all
+#            in milliseconds, for every phrase back to back
+#   phrases: offset of the first note in the notes above and number of notes
+#   calls:   track, phrase and on_ms of the phrase's first note, by on_ms
+# Phrases are relative to their first note, so a section played again later,
+# or on another track, is the same phrase. Only standard Python is used so the
+# expander also runs on MicroPython.
+HEADER = struct.Struct('<IIII')
+NOTE = struct.Struct('<BII')
+PHRASE = struct.Struct('<II')
+CALL = struct.Struct('<BII')
+# Shortest repeat worth a call of its own
+MIN_REPEAT = 4
+# Earlier places a repeat is looked for at, newest first, to bound the search
+MAX_CANDIDATES = 16
+
+# Phrase table of (track, pitch, on_ms, off_ms) notes in on time order,
+# returning (notes, phrases, calls) lists of tuples laid out as above. Each
+# track is cut into repeats of runs already in the notes, found by hashing
+# every MIN_REPEAT notes and extended as far as they match, and runs of new
+# notes between them. Reversed notes get no duration, as in varint streams.
+def compress(rows):
+  tracks = {}
+  for track, pitch, on_ms, off_ms in rows:
+    tracks.setdefault(track, []).append((pitch, on_ms, max(off_ms - on_ms, 0)))
+
+  notes = []
+  phrases = []
+  phrase_ids = {}
+  calls = []
+  # Places in notes of each run of MIN_REPEAT notes, keyed without the gap of
+  # the first since that is not part of a phrase
+  windows = {}
+
+  def add_note(note):
+    notes.append(note)
+    start = len(notes) - MIN_REPEAT
+    if start >= 0:
+      windows.setdefault(window_key(notes, start), []).append(start)
+
+  def call(track, on_ms, offset, length):
+    key = (offset, length)
+    if key not in phrase_ids:
+      phrase_ids[key] = len(phrases)
+      phrases.append(key)
+    calls.append((track, phrase_ids[key], on_ms))
+
+  for track in sorted(tracks):
+    track_notes = tracks[track]
+    gaps = [0] + [track_notes[i][1] - track_notes[i - 1][1] for i in range(1, len(track_notes))]
+    tokens = [(pitch, gap, duration) for (pitch, _, duration), gap in zip(track_notes, gaps)]
+
+    run_start = None
+    index = 0
+    while index < len(tokens):
+      offset, length = find_repeat(notes, windows, tokens, index)
+      if length >= MIN_REPEAT:
+        if run_start is not None:
+          call(track, track_notes[run_start][1], len(notes) - (index - run_start), index - run_start)
+          run_start = None
+        call(track, track_notes[index][1], offset, length)
+        index += length
+        continue
+
+      # New note, the first of a run starts its phrase with no gap
+      if run_start is None:
+        run_start = index
+        add_note((tokens[index][0], 0, tokens[index][2]))
+      else:
+        add_note(tokens[index])
+      index += 1
+
+    if run_start is not None:
+      call(track, track_notes[run_start][1], len(notes) - (len(tokens) - run_start), len(tokens) - run_start)
+
+  calls.sort(key=lambda call: (call[2], call[0]))
+  return notes, phrases, calls
+
+# Key of the MIN_REPEAT notes from start, ignoring the first note's gap
+def window_key(notes, start):
+  first = notes[start]
+  return ((first[0], first[2]),) + tuple(notes[start + 1:start + MIN_REPEAT])
+
+# Longest run of notes already stored that matches tokens from index, as
+# (offset, length), or (0, 0) if none is MIN_REPEAT long
+def find_repeat(notes, windows, tokens, index):
+  if index + MIN_REPEAT > len(tokens):
+    return 0, 0
+  first = tokens[index]
+  key = ((first[0], first[2]),) + tuple(tokens[index + 1:index + MIN_REPEAT])
+  best = (0, 0)
+  for offset in reversed(windows.get(key, [])[-MAX_CANDIDATES:]):
+    length = MIN_REPEAT
+    while (index + length < len(tokens) and offset + length < len(notes)
+        and notes[offset + length] == tokens[index + length]):
+      length += 1
+    if length > best[1]:
+      best = (offset, length)
+  return best
+
+# Bytes of a phrase table
+def encode(notes, phrases, calls):
+  num_notes = sum(phrases[phrase][1] for _, phrase, _ in calls)
+  out = bytearray(HEADER.pack(num_notes, len(phrases), len(notes), len(calls)))
+  for note in notes:
+    out += NOTE.pack(*note)
+  for phrase in phrases:
+    out += PHRASE.pack(*phrase)
+  for phrase_call in calls:
+    out += CALL.pack(*phrase_call)
+  return bytes(out)
+
+# Read the (notes, phrases, calls) of a phrase table
+def decode(blob):
+  num_notes, num_phrases, num_phrase_notes, num_calls = HEADER.unpack_from(blob, 0)
+  pos = HEADER.size
+  notes = [NOTE.unpack_from(blob, pos + i * NOTE.size) for i in range(num_phrase_notes)]
+  pos += num_phrase_notes * NOTE.size
+  phrases = [PHRASE.unpack_from(blob, pos + i * PHRASE.size) for i in range(num_phrases)]
+  pos += num_phrases * PHRASE.size
+  calls = [CALL.unpack_from(blob, pos + i * CALL.size) for i in range(num_calls)]
+  if pos + num_calls * CALL.size != len(blob):
+    raise ValueError(f"Phrase table is {len(blob)} bytes, expected {pos + num_calls * CALL.size}")
+  return notes, phrases, calls
+
+# Yield the (track, pitch, on_ms, off_ms) notes of each call in turn. A phrase
+# can start part way into another, so its first note's gap is skipped.
+def expand(notes, phrases, calls):
+  for track, phrase, on_ms in calls:
+    offset, length = phrases[phrase]
+    for index in range(offset, offset + length):
+      pitch, gap, duration = notes[index]
+      if index != offset:
+        on_ms += gap
+      yield track, pitch, on_ms, on_ms + duration
+
+# Check a phrase table expands back to exactly the notes of a list of
+# (track, pitch, on_ms, off_ms) notes, in any order
+def check(rows, blob):
+  expected = sorted((track, pitch, on_ms, max(off_ms, on_ms)) for track, pitch, on_ms, off_ms in rows)
+  expanded = sorted(expand(*decode(blob)))
+  if len(expanded) != len(expected):
+    raise ValueError(f"Phrase table expands to {len(expanded)} notes, expected {len(expected)}")
+  for index, (note, expanded_note) in enumerate(zip(expected, expanded)):
+    if note != expanded_note:
+      raise ValueError(f"Note {index} expanded as {expanded_note}, expected {note}")
+
+if '__main__' in __name__:
+  # Summarize a phrase table, or with --expand list its notes by on time
+  with open(sys.argv[1], 'rb') as file:
+    blob = file.read()
+  notes, phrases, calls = decode(blob)
+  if '--expand' in sys.argv:
+    for note in sorted(expand(notes, phrases, calls), key=lambda note: note[2]):
+      print(note)
+  else:
+    num_notes = HEADER.unpack_from(blob, 0)[0]
+    print(f"{num_notes} notes from {len(notes)} phrase notes in {len(phrases)} phrases, {len(calls)} calls, {len(blob)} bytes")
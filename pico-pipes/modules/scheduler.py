@@ -0,0 +1,109 @@
+import numpy as np
+
+from modules import tuning
+from modules.voices import DEFAULT_MOTORS
+
+# Cost of one pass of the main loop with no steps taken - four motor_tick()
+# calls, the end check and the next note check
+LOOP_US = 8.0
+# Extra cost of a motor_tick() that takes a step, mostly sleep_us(5)
+STEP_US = 6.0
+# Lateness histogram bucket edges in milliseconds
+BUCKETS_MS = [0, 1, 2, 5, 10, 20, 50, 100, np.inf]
+
+# Times in microseconds from which main() would start each note, and each
+# note's lateness against its intended on time.
+#
+# main() starts the next note once get_ms_now() > on_ms, so never before the
+# next whole millisecond, and only starts one note per pass of the loop. Notes
+# that share an on time queue up behind each other. A pass takes loop_us, made
+# longer by the steps taken while motors are playing.
+def note_starts(timeline, step_delays, loop_us=LOOP_US, step_us=STEP_US, num_motors=DEFAULT_MOTORS):
+  notes = timeline.notes
+  if len(notes) == 0:
+    return np.zeros(0), np.zeros(0)
+
+  on_us = notes['on'] * 1000000
+  ready_us = (np.floor(notes['on'] * 1000) + 1) * 1000
+
+  # Cost of each pass depends on how many steps per second the motors take
+  rate = step_rate_at(timeline, step_delays, num_motors)
+  busy = np.minimum(rate * step_us / 1000000, 0.99)
+  pass_us = loop_us / (1 - busy)
+
+  # start[i] = max(ready[i], start[i - 1] + pass[i]) as a running maximum
+  elapsed = np.cumsum(pass_us)
+  start_us = elapsed + np.maximum.accumulate(ready_us - elapsed)
+  return start_us, start_us - on_us
+
+# Steps per second across all motors when each note starts
+def step_rate_at(timeline, step_delays, num_motors=DEFAULT_MOTORS):
+  notes = timeline.notes
+  delays = np.array(step_delays, dtype=np.float64)
+  times = []
+  changes = []
+
+  for motor in range(num_motors):
+    motor_notes = notes[notes['track'] == motor]
+    if len(motor_notes) == 0:
+      continue
+
+    # A later note on the motor replaces the one playing
+    on = motor_notes['on']
+    end = np.minimum(np.maximum(motor_notes['off'], on), np.append(on[1:], np.inf))
+    delay = delays[motor][motor_notes['pitch']]
+    rate = np.where(delay == tuning.SILENT_DELAY_US, 0, 1000000 / (delay + 1))
+    times += [on, end]
+    changes += [rate, -rate]
+
+  if not times:
+    return np.zeros(len(notes))
+
+  # Ends sort before starts at the same time
+  times = np.concatenate(times)
+  changes = np.concatenate(changes)
+  order = np.lexsort((changes, times))
+  total = np.cumsum(changes[order])
+  index = np.searchsorted(times[order], notes['on'], side='right') - 1
+  return np.where(index >= 0, total[np.maximum(index, 0)], 0)
+
+# Name of a histogram bucket, e.g. '2-5ms'
+def bucket_label(index):
+  low = BUCKETS_MS[index]
+  high = BUCKETS_MS[index + 1]
+  return f"{low}-{high}ms" if np.isfinite(high) else f"{low}+ms"
+
+# Summary of onset lateness for one song
+def lateness_report(name, late_us):
+  late_ms = late_us / 1000
+  counts, _ = np.histogram(late_ms, bins=BUCKETS_MS)
+  if len(late_ms) == 0:
+    late_ms = np.zeros(1)
+  return {
+    'file': name,
+    'notes': int(len(late_us)),
+    'mean_ms': float(late_ms.mean()),
+    'p50_ms': float(np.percentile(late_ms, 50)),
+    'p95_ms': float(np.percentile(late_ms, 95)),
+    'p99_ms': float(np.percentile(late_ms, 99)),
+    'max_ms': float(late_ms.max()),
+    'histogram': {
+      bucket_label(i): int(count) for i, count in enumerate(counts)
+    },
+  }
+
+# Print lateness reports as a table, then the histogram of the worst song
+def print_reports(reports):
+  width = max([len(report['file']) for report in reports] + [4])
+  print(f"{'File':<{width}} {'Notes':>7} {'Mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'Max':>8}")
+  for report in reports:
+    print(
+      f"{report['file']:<{width}} {report['notes']:>7} {report['mean_ms']:>6.2f}ms "
+      f"{report['p50_ms']:>6.2f}ms {report['p95_ms']:>6.2f}ms {report['p99_ms']:>6.2f}ms {report['max_ms']:>6.2f}ms"
+    )
+
+  worst = max(reports, key=lambda report: report['p99_ms'])
+  print(f"\nlateness of {worst['file']}:")
+  peak = max(worst['histogram'].values()) or 1
+  for bucket, count in worst['histogram'].items():
+    print(f"  {bucket:>12} {count:>7} {'#' * int(40 * count / peak)}")
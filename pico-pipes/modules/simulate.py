@@ -0,0 +1,74 @@
+import wave
+
+import numpy as np
+
+from modules import tuning
+from modules.voices import DEFAULT_MOTORS
+
+# Output sample rate
+SAMPLE_RATE = 44100
+# Length of the click made by one step, in seconds
+CLICK_S = 0.002
+# Time base of the firmware clock, one step is taken once more than a whole
+# step delay has passed
+TIMER_US = 1
+
+# Step times in seconds for one motor's notes, in order of on time. Mirrors
+# motor_set_note() and motor_tick(): a note steps from when it starts until its
+# duration has passed or the next note on the same motor replaces it.
+def motor_steps(on, off, step_delay_us):
+  if len(on) == 0:
+    return np.zeros(0)
+
+  # A later note on the motor cuts the previous one short
+  next_on = np.append(on[1:], np.inf)
+  end = np.minimum(np.maximum(off, on), next_on)
+  period = (step_delay_us.astype(np.float64) + TIMER_US) / 1000000
+
+  # Steps at on + k * period while the note is still on
+  counts = np.where(end >= on, np.floor((end - on) / period) + 1, 0)
+  counts = np.where(step_delay_us == tuning.SILENT_DELAY_US, 0, counts).astype(np.int64)
+  note_of_step = np.repeat(np.arange(len(on)), counts)
+  first_step = np.repeat(np.cumsum(counts) - counts, counts)
+  k = np.arange(counts.sum()) - first_step
+  steps = on[note_of_step] + k * period[note_of_step]
+
+  # Steps that land exactly on the next note's start belong to that note
+  return steps[steps < next_on[note_of_step]]
+
+# Render a timeline to mono samples in [-1, 1], one motor per track like main.c
+def render(timeline, step_delays, num_motors=DEFAULT_MOTORS, sample_rate=SAMPLE_RATE):
+  notes = timeline.notes
+  length = int(np.ceil(timeline.duration() * sample_rate)) + int(CLICK_S * sample_rate) + 1
+  mix = np.zeros(length)
+  delays = np.array(step_delays, dtype=np.uint32)
+
+  for motor in range(num_motors):
+    motor_notes = notes[notes['track'] == motor]
+    steps = motor_steps(
+      motor_notes['on'],
+      motor_notes['off'],
+      delays[motor][motor_notes['pitch']]
+    )
+
+    # Impulse train of every step, summed by sample
+    samples = np.round(steps * sample_rate).astype(np.int64)
+    mix += np.bincount(samples, minlength=length)[:length]
+
+  # Each step is a short decaying click
+  click = np.exp(-np.linspace(0, 8, max(int(CLICK_S * sample_rate), 1)))
+  mix = np.convolve(mix, click)[:length]
+  # Remove the DC offset of the clicks so the waveform is centered
+  mix -= np.convolve(mix, np.ones(256) / 256, mode='same')
+
+  peak = np.abs(mix).max()
+  return mix / peak if peak > 0 else mix
+
+# Write mono samples in [-1, 1] as a 16-bit WAV file
+def write_wav(path, samples, sample_rate=SAMPLE_RATE):
+  data = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+  with wave.open(path, 'wb') as file:
+    file.setnchannels(1)
+    file.setsampwidth(2)
+    file.setframerate(sample_rate)
+    file.writeframes(data.tobytes())
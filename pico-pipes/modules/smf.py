@@ -0,0 +1,184 @@
+import bisect
+
+# Tempo until the first set_tempo event, in microseconds per beat (120 BPM)
+DEFAULT_TEMPO = 500000
+# MIDI channel used for drums
+DRUM_CHANNEL = 9
+
+# Note with the same fields compile.py reads from pretty_midi notes
+class Note:
+  __slots__ = ['pitch', 'start', 'end', 'velocity']
+
+  def __init__(self, velocity, pitch, start, end):
+    self.velocity = velocity
+    self.pitch = pitch
+    self.start = start
+    self.end = end
+
+# Instrument with the same fields compile.py reads from pretty_midi instruments
+class Instrument:
+  def __init__(self, program, is_drum, name=''):
+    self.program = program
+    self.is_drum = is_drum
+    self.name = name
+    self.notes = []
+
+# Read a variable length quantity at pos, returning (value, next pos)
+def read_varlen(data, pos):
+  value = 0
+  while True:
+    byte = data[pos]
+    pos += 1
+    value = (value << 7) | (byte & 0x7F)
+    if byte < 0x80:
+      return value, pos
+
+# Yield (tick, status, data1, data2) for the channel events of one track chunk,
+# with absolute ticks. Tempo and track name meta events come through with status
+# 0xFF, the meta type and its value; other meta and sysex events are skipped.
+# A file cut short raises ValueError rather than reading past its end.
+def read_track(data, pos, end):
+  tick = 0
+  status = None
+
+  try:
+    while pos < end:
+      delta, pos = read_varlen(data, pos)
+      tick += delta
+      byte = data[pos]
+
+      if byte == 0xFF:
+        # Meta events don't change the running status
+        kind = data[pos + 1]
+        length, pos = read_varlen(data, pos + 2)
+        if kind == 0x51 and length == 3:
+          yield tick, 0xFF, 0x51, (data[pos] << 16) | (data[pos + 1] << 8) | data[pos + 2]
+        elif kind == 0x03:
+          yield tick, 0xFF, 0x03, bytes(data[pos:pos + length]).decode('latin1')
+        pos += length
+        continue
+
+      if byte in (0xF0, 0xF7):
+        status = byte
+        length, pos = read_varlen(data, pos + 1)
+        pos += length
+        continue
+
+      if byte >= 0x80:
+        status = byte
+        pos += 1
+      elif status is None:
+        raise ValueError('Running status without a previous status byte')
+
+      # Program change and channel pressure have one data byte, the rest two
+      kind = status & 0xF0
+      if kind in (0xC0, 0xD0):
+        yield tick, status, data[pos], 0
+        pos += 1
+      else:
+        yield tick, status, data[pos], data[pos + 1]
+        pos += 2
+  except IndexError:
+    raise ValueError('Track ends in the middle of an event')
+
+# Maps ticks to seconds the same way pretty_midi does - only tempo changes on
+# the first track count, and each tempo's times continue from the last one
+class TempoMap:
+  def __init__(self, resolution, tempos):
+    self.starts = [0]
+    self.scales = [60.0 / ((6e7 / DEFAULT_TEMPO) * resolution)]
+    for tick, tempo in tempos:
+      scale = 60.0 / ((6e7 / tempo) * resolution)
+      if tick == 0:
+        self.starts = [0]
+        self.scales = [scale]
+      elif scale != self.scales[-1]:
+        self.starts.append(tick)
+        self.scales.append(scale)
+
+    # Time each tempo starts at
+    self.bases = [0]
+    for i in range(1, len(self.starts)):
+      self.bases.append(self.bases[-1] + self.scales[i - 1] * (self.starts[i] - self.starts[i - 1]))
+
+  def to_seconds(self, tick):
+    i = bisect.bisect_right(self.starts, tick) - 1
+    return self.bases[i] + self.scales[i] * (tick - self.starts[i])
+
+# Read a Standard MIDI File into instruments, split by program, channel and
+# track like pretty_midi.PrettyMIDI(path).instruments
+def read_instruments(path):
+  with open(path, 'rb') as file:
+    data = memoryview(file.read())
+
+  if bytes(data[0:4]) != b'MThd':
+    raise ValueError(f"{path} is not a MIDI file")
+  header_length = int.from_bytes(data[4:8], 'big')
+  if header_length < 6 or len(data) < 8 + header_length:
+    raise ValueError(f"{path} has a truncated MIDI header")
+  num_tracks = int.from_bytes(data[10:12], 'big')
+  resolution = int.from_bytes(data[12:14], 'big')
+  if resolution & 0x8000:
+    raise ValueError('SMPTE time division is not supported')
+  if resolution == 0:
+    raise ValueError(f"{path} has a time division of 0 ticks per beat")
+
+  # Find each track chunk, skipping any others
+  tracks = []
+  pos = 8 + header_length
+  while pos + 8 <= len(data) and len(tracks) < num_tracks:
+    length = int.from_bytes(data[pos + 4:pos + 8], 'big')
+    if bytes(data[pos:pos + 4]) == b'MTrk':
+      tracks.append((pos + 8, min(pos + 8 + length, len(data))))
+    pos += 8 + length
+
+  # Tempo map comes from the first track only
+  tempos = []
+  if tracks:
+    tempos = [
+      (tick, value) for tick, status, kind, value in read_track(data, *tracks[0])
+      if status == 0xFF and kind == 0x51
+    ]
+  tempo_map = TempoMap(resolution, tempos)
+
+  instruments = {}
+  for track_index, (start, end) in enumerate(tracks):
+    programs = [0] * 16
+    open_notes = {}
+    name = ''
+
+    for tick, status, data1, data2 in read_track(data, start, end):
+      if status == 0xFF:
+        if data1 == 0x03:
+          name = data2
+        continue
+
+      kind = status & 0xF0
+      channel = status & 0x0F
+      if kind == 0xC0:
+        programs[channel] = data1
+      elif kind == 0x90 and data2 > 0:
+        open_notes.setdefault((channel, data1), []).append((tick, data2))
+      elif kind == 0x80 or kind == 0x90:
+        key = (channel, data1)
+        if key not in open_notes:
+          continue
+
+        # A note off closes every earlier note on of the same pitch, but not
+        # one that started on this same tick
+        to_close = [note for note in open_notes[key] if note[0] != tick]
+        to_keep = [note for note in open_notes[key] if note[0] == tick]
+        for on_tick, velocity in to_close:
+          instrument_key = (programs[channel], channel, track_index)
+          if instrument_key not in instruments:
+            instruments[instrument_key] = Instrument(programs[channel], channel == DRUM_CHANNEL, name)
+          instruments[instrument_key].notes.append(
+            Note(velocity, data1, tempo_map.to_seconds(on_tick), tempo_map.to_seconds(tick))
+          )
+
+        if to_close and to_keep:
+          open_notes[key] = to_keep
+        else:
+          del open_notes[key]
+
+  return list(instruments.values())
@@ -0,0 +1,50 @@
+import numpy as np
+
+# Integer time base every target is written from, in microseconds per tick.
+# Times are rounded to it once, and each target's units (milliseconds,
+# microseconds, varint ticks, decimal seconds) are worked out from the ticks
+# with integer arithmetic. 10us keeps the 5 decimal places of seconds that
+# float tables have always been written with.
+TICK_US = 10
+US_PER_SECOND = 1000000
+
+# Times in seconds as whole ticks, for a whole array at once
+def to_ticks(seconds, tick_us=TICK_US):
+  return np.rint(np.asarray(seconds, dtype=np.float64) * (US_PER_SECOND / tick_us)).astype(np.int64)
+
+# Ticks as whole units of unit_us microseconds, rounding halves up. Works on
+# ints and integer arrays alike.
+def convert(ticks, unit_us, tick_us=TICK_US):
+  if unit_us == tick_us:
+    return ticks
+  return (ticks * tick_us + unit_us // 2) // unit_us
+
+# Ticks as whole milliseconds
+def to_ms(ticks, tick_us=TICK_US):
+  return convert(ticks, 1000, tick_us)
+
+# Ticks as a decimal number of seconds, written without going through a float
+# so tables hold exactly the time base, e.g. 133333 ticks -> '1.33333'
+def format_seconds(ticks, tick_us=TICK_US):
+  whole, fraction = divmod(ticks * tick_us, US_PER_SECOND)
+  return f"{whole}.{f'{fraction:06d}'.rstrip('0') or '0'}"
+
+# Largest difference in microseconds between times in seconds and the times of
+# their ticks in some unit. Each unit is rounded from the absolute time, never
+# from a previous note, so this is at most half a tick plus half a unit however
+# long the song is.
+def max_error_us(seconds, ticks, unit_us=TICK_US, tick_us=TICK_US):
+  if len(seconds) == 0:
+    return 0.0
+  units = convert(np.asarray(ticks, dtype=np.int64), unit_us, tick_us)
+  return float(np.abs(units * unit_us - np.asarray(seconds, dtype=np.float64) * US_PER_SECOND).max())
+
+# Raise if times rounded to ticks and then to some unit are further from the
+# original times than the rounding allows
+def check(seconds, ticks, unit_us=TICK_US, tick_us=TICK_US):
+  bound = tick_us / 2 + (unit_us / 2 if unit_us != tick_us else 0)
+  error = max_error_us(seconds, ticks, unit_us, tick_us)
+  # Float seconds of long songs are only exact to a fraction of a microsecond
+  if error > bound + 0.01:
+    raise ValueError(f"Times are {error:.2f}us from their {unit_us}us units, more than {bound}us")
+  return error
@@ -0,0 +1,159 @@
+import heapq
+from operator import itemgetter
+
+import numpy as np
+
+from modules import ticks
+
+# One row per note - times are in seconds
+NOTE_DTYPE = np.dtype([
+  ('track', np.uint8),
+  ('pitch', np.uint8),
+  ('on', np.float64),
+  ('off', np.float64),
+])
+# Notes of a track rounded to ticks at once when merging lazily
+TICK_CHUNK = 4096
+
+# Notes of all selected tracks, sorted by on time
+class NoteTimeline:
+  def __init__(self, notes, file_name='', summaries=None):
+    self.notes = notes
+    self.file_name = file_name
+    self.summaries = summaries or []
+
+  def __len__(self):
+    return len(self.notes)
+
+  # Iterate (track, pitch, on, off) rows as plain Python values
+  def __iter__(self):
+    return zip(
+      self.notes['track'].tolist(),
+      self.notes['pitch'].tolist(),
+      self.notes['on'].tolist(),
+      self.notes['off'].tolist(),
+    )
+
+  # Iterate (track, pitch, on, off) rows with times in whole ticks, rounded
+  # once for the whole timeline
+  def tick_rows(self, tick_us=ticks.TICK_US):
+    return zip(
+      self.notes['track'].tolist(),
+      self.notes['pitch'].tolist(),
+      ticks.to_ticks(self.notes['on'], tick_us).tolist(),
+      ticks.to_ticks(self.notes['off'], tick_us).tolist(),
+    )
+
+  @property
+  def tracks(self):
+    return self.notes['track']
+
+  @property
+  def pitches(self):
+    return self.notes['pitch']
+
+  @property
+  def on(self):
+    return self.notes['on']
+
+  @property
+  def off(self):
+    return self.notes['off']
+
+  # Length of the song in seconds
+  def duration(self):
+    return float(self.notes['off'].max()) if len(self.notes) else 0.0
+
+  # One past the highest track that plays a note
+  def num_tracks(self):
+    return int(self.notes['track'].max()) + 1 if len(self.notes) else 0
+
+  # First 'count' notes as a new timeline
+  def head(self, count):
+    return NoteTimeline(self.notes[:count], self.file_name, self.summaries)
+
+  # Keep only some tracks, renumbered in the order given
+  def select(self, tracks):
+    tracks = [int(track) for track in tracks]
+    mapping = np.full(256, -1, dtype=np.int16)
+    mapping[tracks] = np.arange(len(tracks))
+    notes = self.notes[mapping[self.notes['track']] >= 0].copy()
+    notes['track'] = mapping[notes['track']]
+    summaries = [self.summaries[track] for track in tracks if track < len(self.summaries)]
+    return NoteTimeline(notes, self.file_name, summaries)
+
+# Build a sorted timeline from lists of pretty_midi notes, one list per track
+def from_note_lists(note_lists, file_name='', summaries=None):
+  notes = np.empty(sum(len(n) for n in note_lists), dtype=NOTE_DTYPE)
+  start = 0
+  for track, track_notes in enumerate(note_lists):
+    end = start + len(track_notes)
+    notes['track'][start:end] = track
+    notes['pitch'][start:end] = [note.pitch for note in track_notes]
+    notes['on'][start:end] = [note.start for note in track_notes]
+    notes['off'][start:end] = [note.end for note in track_notes]
+    start = end
+
+  # Stable, so notes at the same time stay in track order
+  notes = notes[np.argsort(notes['on'], kind='stable')]
+  return NoteTimeline(notes, file_name, summaries)
+
+# Notes of each track in on time order as (track, pitch, on, off) rows. Tracks
+# are usually already in order, which sorted() handles in one pass.
+def track_rows(track, track_notes):
+  for note in sorted(track_notes, key=lambda note: note.start):
+    yield track, note.pitch, note.start, note.end
+
+# Notes of a track as (track, pitch, on, on_tick, off_tick) rows in on time
+# order, with times rounded to ticks TICK_CHUNK notes at a time so the ticks
+# held don't grow with the length of the track
+def track_tick_rows(track, track_notes, tick_us=ticks.TICK_US):
+  track_notes = sorted(track_notes, key=lambda note: note.start)
+  for start in range(0, len(track_notes), TICK_CHUNK):
+    chunk = track_notes[start:start + TICK_CHUNK]
+    on = ticks.to_ticks([note.start for note in chunk], tick_us).tolist()
+    off = ticks.to_ticks([note.end for note in chunk], tick_us).tolist()
+    for note, on_tick, off_tick in zip(chunk, on, off):
+      yield track, note.pitch, note.start, on_tick, off_tick
+
+# Notes of all selected tracks merged lazily by on time, without building one
+# sorted table of every note. Iterating it yields the same rows in the same order
+# as from_note_lists(), holding only one pending note per track besides each
+# track's notes in on time order, and stops merging when the caller stops
+# reading (e.g. emitters that are all full).
+class MergedTimeline:
+  def __init__(self, note_lists, file_name='', summaries=None):
+    self.note_lists = note_lists
+    self.file_name = file_name
+    self.summaries = summaries or []
+
+  def __len__(self):
+    return sum(len(track_notes) for track_notes in self.note_lists)
+
+  # Ties keep track order, like the stable sort of from_note_lists()
+  def __iter__(self):
+    return heapq.merge(
+      *[track_rows(track, track_notes) for track, track_notes in enumerate(self.note_lists)],
+      key=itemgetter(2)
+    )
+
+  # Rows as from __iter__ with times in whole ticks. Merged on the times in
+  # seconds, so the order is still the same as from_note_lists().
+  def tick_rows(self, tick_us=ticks.TICK_US):
+    merged = heapq.merge(
+      *[track_tick_rows(track, track_notes, tick_us) for track, track_notes in enumerate(self.note_lists)],
+      key=itemgetter(2)
+    )
+    return ((track, pitch, on, off) for track, pitch, _, on, off in merged)
+
+  # Length of the song in seconds
+  def duration(self):
+    return max((note.end for track_notes in self.note_lists for note in track_notes), default=0.0)
+
+  # One past the highest track that plays a note
+  def num_tracks(self):
+    return max((track + 1 for track, track_notes in enumerate(self.note_lists) if len(track_notes)), default=0)
+
+  # Sorted table of every note, for passes that need the whole song at once
+  def to_timeline(self):
+    return from_note_lists(self.note_lists, self.file_name, self.summaries)
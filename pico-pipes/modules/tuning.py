@@ -0,0 +1,53 @@
+import json
+import os
+import re
+
+import numpy as np
+
+# Pitch table shared with the firmware
+PITCHES_H = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pitches.h')
+# Step delay for pitches with no frequency - the motor never steps
+SILENT_DELAY_US = 0xFFFFFFFF
+# Frequency pitch_get_freq() uses for pitches past the end of the table
+OUT_OF_TABLE_FREQ = 1
+# Tracks are stored in a byte, so the step delay table has a row for each of
+# them and any track or motor can be tuned
+MAX_MOTORS = 256
+
+# Read the frequencies from pitches.h
+def load_pitch_table(path=PITCHES_H):
+  with open(path) as file:
+    body = file.read().split('{', 1)[1].split('}', 1)[0]
+
+  # Values are one per line, followed by an optional comment
+  return [float(line.split(',')[0]) for line in body.splitlines() if re.match(r'\s*[0-9.]', line)]
+
+# Read per-motor tuning offsets in cents, e.g. { "0": 12, "3": -7.5 }
+def load_calibration(path):
+  with open(path) as file:
+    offsets = json.load(file)
+  calibration = { int(motor): float(cents) for motor, cents in offsets.items() }
+  for motor in calibration:
+    if not 0 <= motor < MAX_MOTORS:
+      raise ValueError(f"Calibration for motor {motor} in {path}, motors are 0 to {MAX_MOTORS - 1}")
+  return calibration
+
+# Step delay table of [motor][pitch] in whole microseconds. Float32 maths to
+# match what the firmware computes from pitch_table, then tuned per motor.
+def step_delay_table(pitch_table, calibration=None):
+  freqs = np.full(256, OUT_OF_TABLE_FREQ, dtype=np.float32)
+  freqs[:len(pitch_table)] = pitch_table
+  # pitch_get_freq() only falls back for pitches past PITCH_TABLE_SIZE
+  freqs[len(pitch_table)] = 0
+
+  tuning = np.zeros(MAX_MOTORS)
+  for motor, cents in (calibration or {}).items():
+    tuning[motor] = cents
+  factors = np.power(2.0, tuning / 1200).astype(np.float32)
+
+  tuned = freqs[np.newaxis, :] * factors[:, np.newaxis]
+  with np.errstate(divide='ignore'):
+    delays = np.float32(1000000) / tuned
+  delays = np.trunc(delays).astype(np.float64)
+  delays = np.where(tuned > 0, np.minimum(delays, SILENT_DELAY_US), SILENT_DELAY_US)
+  return delays.astype(np.uint32).tolist()
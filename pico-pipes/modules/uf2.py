@@ -0,0 +1,121 @@
+import struct
+import sys
+import zlib
+
+# UF2 block layout: magic, magic, flags, target address, payload size, block
+# number, number of blocks, family ID, data, magic
+BLOCK = struct.Struct('<IIIIIIII476sI')
+MAGIC_START0 = 0x0A324655
+MAGIC_START1 = 0x9E5D5157
+MAGIC_END = 0x0AB16F30
+# Blocks carry a family ID rather than a file size
+FLAG_FAMILY_ID = 0x00002000
+# Family ID the RP2040 bootloader accepts
+RP2040_FAMILY_ID = 0xE48BFF56
+# Bytes of flash written by each block
+PAYLOAD_SIZE = 256
+
+# Start of flash in the RP2040 address space
+FLASH_BASE = 0x10000000
+# Flash region reserved for the note table, must match NOTE_FLASH_OFFSET in main.h.
+# The firmware itself has to fit in the first megabyte.
+REGION_OFFSET = 1024 * 1024
+REGION_SIZE = 1024 * 1024
+REGION_ADDRESS = FLASH_BASE + REGION_OFFSET
+
+# Region header matching 'struct NoteFlashHeader' - magic, kind, num_notes and
+# CRC-32 of the rows that follow
+REGION_HEADER = struct.Struct('<IIII')
+REGION_MAGIC = 0x544E5050
+# Kinds of rows, matching NOTE_FLASH_PACKED and NOTE_FLASH_TIMED
+KIND_PACKED = 1
+KIND_TIMED = 2
+# Magic of a song bundle (bundle.MAGIC) in place of a single table
+BUNDLE_MAGIC = 0x53425050
+# Bytes per row of each kind, the sizes of packed.RECORD and packed.TIMED_RECORD
+RECORD_SIZES = {KIND_PACKED: 12, KIND_TIMED: 16}
+
+# Contents of the note region for rows of packed.RECORD or packed.TIMED_RECORD
+def region(kind, num_notes, rows):
+  data = REGION_HEADER.pack(REGION_MAGIC, kind, num_notes, zlib.crc32(rows)) + rows
+  if len(data) > REGION_SIZE:
+    raise ValueError(f"Note table is {len(data)} bytes, the flash region holds {REGION_SIZE}")
+  return data
+
+# Read back the (kind, num_notes, rows) of a note region, checking its CRC
+def read_region(data):
+  magic, kind, num_notes, crc = REGION_HEADER.unpack_from(data)
+  if magic != REGION_MAGIC:
+    raise ValueError('No note table in the flash region')
+  end = REGION_HEADER.size + num_notes * RECORD_SIZES[kind]
+  rows = bytes(data[REGION_HEADER.size:end])
+  if len(rows) != end - REGION_HEADER.size or zlib.crc32(rows) != crc:
+    raise ValueError('Note table in the flash region is damaged')
+  return kind, num_notes, rows
+
+# Split bytes at an address into (address, payload) pieces of one block each
+def to_payloads(data, address):
+  return [
+    (address + offset, data[offset:offset + PAYLOAD_SIZE])
+    for offset in range(0, len(data), PAYLOAD_SIZE)
+  ]
+
+# UF2 file of (address, payload) pieces, numbered in order
+def encode(payloads, family_id=RP2040_FAMILY_ID):
+  out = bytearray()
+  for number, (address, payload) in enumerate(payloads):
+    out += BLOCK.pack(
+      MAGIC_START0, MAGIC_START1, FLAG_FAMILY_ID, address, PAYLOAD_SIZE,
+      number, len(payloads), family_id, payload.ljust(PAYLOAD_SIZE, b'\xff'), MAGIC_END
+    )
+  return bytes(out)
+
+# List the (address, payload) pieces and the family ID of a UF2 file
+def decode(image):
+  if len(image) % BLOCK.size != 0:
+    raise ValueError(f"UF2 size {len(image)} is not a multiple of {BLOCK.size}")
+
+  payloads = []
+  family_id = RP2040_FAMILY_ID
+  for fields in BLOCK.iter_unpack(image):
+    start0, start1, flags, address, size, _, _, family, data, end = fields
+    if (start0, start1, end) != (MAGIC_START0, MAGIC_START1, MAGIC_END):
+      raise ValueError(f"Block {len(payloads)} is not a UF2 block")
+    if flags & FLAG_FAMILY_ID:
+      family_id = family
+    payloads.append((address, data[:size]))
+  return payloads, family_id
+
+# UF2 file of just the note region, to flash a new song over installed firmware
+def region_image(data):
+  return encode(to_payloads(data, REGION_ADDRESS))
+
+# Firmware UF2 with the note region replaced, renumbering every block
+def patch(firmware, data):
+  payloads, family_id = decode(firmware)
+  region_end = REGION_ADDRESS + REGION_SIZE
+  kept = []
+  for address, payload in payloads:
+    # Blocks of a song patched in before are replaced
+    if REGION_ADDRESS <= address < region_end:
+      continue
+    if address < region_end and address + len(payload) > REGION_ADDRESS:
+      raise ValueError(f"Firmware at {address:#x} overlaps the note flash region")
+    kept.append((address, payload))
+  return encode(kept + to_payloads(data, REGION_ADDRESS), family_id)
+
+if '__main__' in __name__:
+  # Summarize a UF2 file and the note table in it, if any
+  with open(sys.argv[1], 'rb') as file:
+    payloads, family_id = decode(file.read())
+  print(f"{len(payloads)} blocks, family {family_id:#x}")
+
+  in_region = b''.join(
+    payload for address, payload in sorted(payloads)
+    if REGION_ADDRESS <= address < REGION_ADDRESS + REGION_SIZE
+  )
+  if in_region and REGION_HEADER.unpack_from(in_region)[0] == BUNDLE_MAGIC:
+    print(f"song bundle: {REGION_HEADER.unpack_from(in_region)[2]} songs, list them with modules/bundle.py")
+  elif in_region:
+    kind, num_notes, rows = read_region(in_region)
+    print(f"note table: {num_notes} {'timed' if kind == KIND_TIMED else 'packed'} notes, {len(rows)} bytes")
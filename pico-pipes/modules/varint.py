@@ -0,0 +1,99 @@
+import sys
+
+# Default length of one tick of the stream time base
+TICK_US = 1000
+# Tracks share a byte-aligned varint with the pitch, in the low nibble
+MAX_TRACKS = 16
+
+# Note stream layout, all fields unsigned LEB128 varints:
+#   header: num_notes, tick_us
+#   note:   on time delta from the previous note, duration, (pitch << 4) | track
+# Times are in ticks. Only standard Python is used so this decoder also runs on
+# MicroPython, and note_stream.h is the matching C decoder.
+
+# Append an unsigned varint to a bytearray
+def put_varint(out, value):
+  while value > 0x7F:
+    out.append((value & 0x7F) | 0x80)
+    value >>= 7
+  out.append(value)
+
+# Read an unsigned varint at pos, returning (value, next pos)
+def get_varint(blob, pos):
+  value = 0
+  shift = 0
+  while True:
+    byte = blob[pos]
+    pos += 1
+    value |= (byte & 0x7F) << shift
+    if byte < 0x80:
+      return value, pos
+    shift += 7
+
+# Encodes notes one at a time, tracking the previous on time
+class Encoder:
+  def __init__(self, tick_us=TICK_US):
+    self.tick_us = tick_us
+    self.last_on = 0
+
+  # Stream header bytes
+  def header(self, num_notes):
+    out = bytearray()
+    put_varint(out, num_notes)
+    put_varint(out, self.tick_us)
+    return out
+
+  # Bytes for one note with times in whole ticks, rounded from the absolute
+  # times so deltas never accumulate error. Notes must be in order of on time.
+  def note_ticks(self, track, pitch, on, off):
+    if track >= MAX_TRACKS:
+      raise ValueError(f"Track {track} does not fit in a nibble")
+
+    out = bytearray()
+    put_varint(out, on - self.last_on)
+    put_varint(out, max(off - on, 0))
+    put_varint(out, (pitch << 4) | track)
+    self.last_on = on
+    return out
+
+# Yield (track, pitch, on_tick, off_tick) notes and the tick length from a stream
+def decode_ticks(blob):
+  num_notes, pos = get_varint(blob, 0)
+  tick_us, pos = get_varint(blob, pos)
+  on = 0
+  for _ in range(num_notes):
+    delta, pos = get_varint(blob, pos)
+    duration, pos = get_varint(blob, pos)
+    packed, pos = get_varint(blob, pos)
+    on += delta
+    yield packed & 0x0F, packed >> 4, on, on + duration
+
+# Decode a stream into a list of (track, pitch, on_at, off_at) notes in seconds
+def decode(blob):
+  tick_us, _ = get_varint(blob, get_varint(blob, 0)[1])
+  scale = tick_us / 1000000
+  return [
+    (track, pitch, on * scale, off * scale)
+    for track, pitch, on, off in decode_ticks(blob)
+  ]
+
+# Check a stream reproduces a list of notes to within half a tick
+def check(notes, blob):
+  decoded = decode(blob)
+  if len(decoded) != len(notes):
+    raise ValueError(f"Stream has {len(decoded)} notes, expected {len(notes)}")
+
+  tick_us, _ = get_varint(blob, get_varint(blob, 0)[1])
+  tolerance = tick_us / 2000000 + 1e-9
+  for index, (note, decoded_note) in enumerate(zip(notes, decoded)):
+    # Durations of reversed notes are clamped to zero
+    off_at = max(note[2], note[3])
+    if (note[0:2] != decoded_note[0:2]
+        or abs(note[2] - decoded_note[2]) > tolerance
+        or abs(off_at - decoded_note[3]) > tolerance):
+      raise ValueError(f"Note {index} decoded as {decoded_note}, expected {note}")
+
+if '__main__' in __name__:
+  with open(sys.argv[1], 'rb') as file:
+    for note in decode(file.read()):
+      print(note)
@@ -0,0 +1,76 @@
+import numpy as np
+
+from modules.timeline import NoteTimeline
+
+# Motors driven by one Pico
+DEFAULT_MOTORS = 4
+
+# Assign every note to one of num_motors motors, returning the new timeline and
+# a report. A note goes to the free motor that has been free the longest. If
+# none are free, the note is dropped, or with steal it takes over the motor
+# playing the oldest note, which is cut short.
+def allocate(timeline, num_motors=DEFAULT_MOTORS, steal=False):
+  notes = timeline.notes
+  motor_of = np.full(len(notes), -1, dtype=np.int16)
+  offs = notes['off'].copy()
+
+  # Per motor: time it is busy until, time it was freed, and note it is playing
+  busy_until = [float('-inf')] * num_motors
+  freed_at = [float('-inf')] * num_motors
+  playing = [-1] * num_motors
+  num_tracks = max(len(timeline.summaries), int(notes['track'].max()) + 1 if len(notes) else 0)
+  stolen = np.zeros(num_tracks, dtype=np.int64)
+
+  for index, on in enumerate(notes['on'].tolist()):
+    # Motors whose note has ended by now are free again
+    for motor in range(num_motors):
+      if playing[motor] != -1 and busy_until[motor] <= on:
+        freed_at[motor] = busy_until[motor]
+        playing[motor] = -1
+
+    free = [motor for motor in range(num_motors) if playing[motor] == -1]
+    if free:
+      motor = min(free, key=lambda m: freed_at[m])
+    elif steal:
+      motor = min(range(num_motors), key=lambda m: notes['on'][playing[m]])
+      offs[playing[motor]] = on
+      stolen[notes['track'][playing[motor]]] += 1
+    else:
+      continue
+
+    motor_of[index] = motor
+    playing[motor] = index
+    busy_until[motor] = offs[index]
+
+  # Report what each source track lost
+  dropped = motor_of == -1
+  dropped_per_track = np.bincount(notes['track'][dropped], minlength=len(timeline.summaries))
+
+  kept = notes[~dropped].copy()
+  kept['track'] = motor_of[~dropped]
+  kept['off'] = offs[~dropped]
+  report = {
+    'motors': num_motors,
+    'notes': len(notes),
+    'dropped': int(dropped.sum()),
+    'stolen': int(stolen.sum()),
+    'dropped_per_track': dropped_per_track.tolist(),
+    'stolen_per_track': stolen.tolist(),
+  }
+  # Tracks are motors from here on, so later reports name motors
+  summaries = [f"Motor {motor}" for motor in range(num_motors)]
+  return NoteTimeline(kept, timeline.file_name, summaries), report
+
+# Print a voice allocation report, naming the source tracks from their
+# summaries before allocation
+def print_report(report, summaries):
+  print(f"\nvoices: {report['notes']} notes on {report['motors']} motors, "
+    f"{report['dropped']} dropped, {report['stolen']} stolen")
+  for track, count in enumerate(report['dropped_per_track']):
+    if count > 0:
+      name = summaries[track] if track < len(summaries) else f"Track {track}"
+      print(f"  dropped {count} notes from {name}")
+  for track, count in enumerate(report['stolen_per_track']):
+    if count > 0:
+      name = summaries[track] if track < len(summaries) else f"Track {track}"
+      print(f"  cut short {count} notes from {name}")
@@ -0,0 +1,67 @@
+#ifndef NOTE_STREAM_H
+#define NOTE_STREAM_H
+
+#include <stdint.h>
+
+/**
+ * Reader for a varint note stream from compile.py --varint.
+ *
+ * Stream is a header of num_notes and tick_us, then for each note the on time
+ * delta from the previous note, the duration, and (pitch << 4) | track. All
+ * fields are unsigned LEB128 varints, times are in ticks.
+ */
+struct NoteStream {
+  const uint8_t *pos;
+  uint32_t num_notes;
+  uint32_t tick_us;
+  uint32_t index;
+  uint32_t on_tick;
+};
+
+/**
+ * Read one varint and advance past it.
+ */
+static uint32_t note_stream_varint(const uint8_t **pos) {
+  uint32_t value = 0;
+  int shift = 0;
+  uint8_t byte;
+
+  do {
+    byte = *(*pos)++;
+    value |= (uint32_t)(byte & 0x7F) << shift;
+    shift += 7;
+  } while (byte & 0x80);
+
+  return value;
+};
+
+/**
+ * Start reading a stream from its header.
+ */
+static void note_stream_init(struct NoteStream *s, const uint8_t *data) {
+  s->pos = data;
+  s->num_notes = note_stream_varint(&s->pos);
+  s->tick_us = note_stream_varint(&s->pos);
+  s->index = 0;
+  s->on_tick = 0;
+};
+
+/**
+ * Read the next note, returns 0 when there are no more.
+ */
+static int note_stream_next(struct NoteStream *s, uint8_t *track, uint8_t *pitch, uint32_t *on_tick, uint32_t *off_tick) {
+  if (s->index == s->num_notes) return 0;
+
+  s->on_tick += note_stream_varint(&s->pos);
+  uint32_t duration = note_stream_varint(&s->pos);
+  uint32_t packed = note_stream_varint(&s->pos);
+
+  *track = packed & 0x0F;
+  *pitch = packed >> 4;
+  *on_tick = s->on_tick;
+  *off_tick = s->on_tick + duration;
+  s->index += 1;
+  return 1;
+};
+
+#endif
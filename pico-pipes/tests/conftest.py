@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the helpers the way compile.py does, as 'from modules import x'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
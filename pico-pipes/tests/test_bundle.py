@@ -0,0 +1,49 @@
+import pytest
+
+from modules import bundle
+
+# Rows of a song of notes on the given tracks and pitches, spaced gap_ms apart
+def make_rows(kind, notes, start_ms=0, gap_ms=125):
+  rows = []
+  for i, (track, pitch) in enumerate(notes):
+    on_ms = start_ms + i * gap_ms
+    if kind == bundle.KIND_PACKED:
+      rows.append((track, pitch, on_ms, on_ms + 100))
+    else:
+      rows.append((track, pitch, on_ms, 100000, 2000))
+  return rows
+
+def pack(kind, rows):
+  return b''.join(bundle.ROWS[kind].pack(*row) for row in rows)
+
+# A verse played twice, then again in a second song at another time
+VERSE = [(i % 3, 60 + i) for i in range(12)]
+BRIDGE = [(0, 40 + i) for i in range(5)]
+
+@pytest.mark.parametrize('kind', [bundle.KIND_PACKED, bundle.KIND_TIMED])
+def test_repeated_sections_are_shared(kind):
+  first = make_rows(kind, VERSE + BRIDGE + VERSE)
+  second = make_rows(kind, BRIDGE + VERSE, start_ms=7)
+  songs = [('first', pack(kind, first), len(first), 5000), ('second', pack(kind, second), len(second), 3000)]
+  data, shared = bundle.build(songs, kind)
+
+  # Both later verses point at the first one's rows
+  assert shared == 2 * len(VERSE) * bundle.RECORD_SIZES[kind]
+  read_kind, read_songs = bundle.read(data)
+  assert read_kind == kind
+  assert [song['rows'] for song in read_songs] == [songs[0][1], songs[1][1]]
+  assert [song['num_segments'] for song in read_songs] == [2, 2]
+
+def test_short_repeats_are_stored_again():
+  rows = make_rows(bundle.KIND_PACKED, VERSE[:4] + BRIDGE + VERSE[:4])
+  data, shared = bundle.build([('song', pack(bundle.KIND_PACKED, rows), len(rows), 2000)])
+  assert shared == 0
+  assert bundle.read(data)[1][0]['rows'] == pack(bundle.KIND_PACKED, rows)
+
+def test_damaged_bundle():
+  rows = make_rows(bundle.KIND_PACKED, VERSE)
+  data, _ = bundle.build([('song', pack(bundle.KIND_PACKED, rows), len(rows), 2000)])
+  with pytest.raises(ValueError, match='damaged'):
+    bundle.read(data[:-1] + bytes([data[-1] ^ 1]))
+  with pytest.raises(ValueError, match='Not a song bundle'):
+    bundle.read(bytes(len(data)))
@@ -0,0 +1,34 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from modules import header, scheduler, tuning
+from modules.timeline import NOTE_DTYPE, NoteTimeline
+
+NOTES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'notes')
+# Notes start on the next whole millisecond, plus a few passes of the loop for
+# chords. Busier songs than this start audibly late.
+MAX_P99_MS = 1.5
+
+@pytest.fixture(scope='module')
+def step_delays():
+  return tuning.step_delay_table(tuning.load_pitch_table())
+
+@pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(NOTES_DIR, '*.h'))), ids=os.path.basename)
+def test_song_starts_notes_on_time(path, step_delays):
+  _, late_us = scheduler.note_starts(header.read_header(path), step_delays)
+  report = scheduler.lateness_report(os.path.basename(path), late_us)
+  assert report['p99_ms'] <= MAX_P99_MS
+
+# Notes of a chord start one pass of the loop after each other
+def test_chord_notes_queue_up(step_delays):
+  notes = np.zeros(4, dtype=NOTE_DTYPE)
+  notes['track'] = np.arange(4)
+  notes['pitch'] = 60
+  notes['on'] = 1.0
+  notes['off'] = 2.0
+  start_us, _ = scheduler.note_starts(NoteTimeline(notes), step_delays)
+  assert start_us[0] == 1001000
+  assert np.all(np.diff(start_us) >= scheduler.LOOP_US)
@@ -0,0 +1,83 @@
+import pytest
+
+from modules import smf
+
+# Variable length quantity bytes of a value
+def varlen(value):
+  out = [value & 0x7F]
+  value >>= 7
+  while value:
+    out.insert(0, (value & 0x7F) | 0x80)
+    value >>= 7
+  return bytes(out)
+
+# Track chunk of (delta, event bytes) pairs, ended with end of track
+def track(*events):
+  body = b''.join(varlen(delta) + bytes(event) for delta, event in events) + b'\x00\xff\x2f\x00'
+  return b'MTrk' + len(body).to_bytes(4, 'big') + body
+
+# Format 1 file of some track chunks
+def midi_file(*tracks, resolution=96):
+  return b'MThd' + (6).to_bytes(4, 'big') + b'\x00\x01' + len(tracks).to_bytes(2, 'big') + resolution.to_bytes(2, 'big') + b''.join(tracks)
+
+def tempo(microseconds):
+  return b'\xff\x51\x03' + microseconds.to_bytes(3, 'big')
+
+# Songs that exercise the parts of the format the reader handles itself
+SONGS = {
+  'running status': midi_file(track(
+    (0, b'\xc0\x05'),
+    (0, b'\x90\x3c\x40'), (0, b'\x40\x40'), (48, b'\x3c\x00'), (0, b'\x40\x00'),
+    (48, b'\x80\x43\x40'), (0, b'\x90\x43\x40'), (96, b'\x43\x00'),
+  )),
+  'sysex': midi_file(track(
+    (0, b'\xf0\x05\x7e\x7f\x09\x01\xf7'),
+    (0, b'\x90\x3c\x40'),
+    (24, b'\xf7\x03\x01\x02\x03'),
+    (24, b'\x80\x3c\x40'),
+    (0, b'\xff\x01\x04text'),
+    (0, b'\x91\x3e\x40'), (96, b'\x81\x3e\x40'),
+  )),
+  'tempo changes': midi_file(
+    track((0, tempo(400000)), (96, tempo(250000)), (96, tempo(250000)), (48, tempo(1000000))),
+    track((0, b'\x90\x3c\x40'), (120, b'\x80\x3c\x40'), (0, b'\x90\x3e\x40'), (200, b'\x80\x3e\x40')),
+    resolution=120,
+  ),
+  'same tick on and off': midi_file(track(
+    (0, b'\x90\x3c\x40'), (48, b'\x80\x3c\x40'), (0, b'\x90\x3c\x40'),
+    (0, b'\x90\x3c\x00'), (48, b'\x80\x3c\x40'),
+    (0, b'\x90\x40\x40'), (0, b'\x90\x40\x50'), (48, b'\x80\x40\x40'),
+  )),
+  'programs and drums': midi_file(
+    track((0, b'\xff\x03\x04lead'), (0, b'\xc1\x10'), (0, b'\x91\x3c\x40'), (48, b'\x81\x3c\x40'), (0, b'\xc1\x20'), (0, b'\x91\x3c\x40'), (48, b'\x81\x3c\x40')),
+    track((0, b'\x99\x24\x40'), (24, b'\x89\x24\x40')),
+  ),
+}
+
+def notes(instrument):
+  return [(note.pitch, note.start, note.end) for note in instrument.notes]
+
+def write(tmp_path, data):
+  path = tmp_path / 'song.mid'
+  path.write_bytes(data)
+  return str(path)
+
+@pytest.mark.parametrize('name', SONGS.keys())
+def test_reader_matches_pretty_midi(tmp_path, name):
+  pretty_midi = pytest.importorskip('pretty_midi')
+  path = write(tmp_path, SONGS[name])
+  builtin = smf.read_instruments(path)
+  expected = pretty_midi.PrettyMIDI(path).instruments
+  assert [(instrument.program, instrument.is_drum) for instrument in builtin] == [(instrument.program, instrument.is_drum) for instrument in expected]
+  for instrument, other in zip(builtin, expected):
+    assert notes(instrument) == pytest.approx(notes(other))
+
+@pytest.mark.parametrize('data, message', [
+  (b'MThd\x00\x00\x00\x06\x00\x01', 'truncated MIDI header'),
+  (b'MThd\x00\x00\x00\x06\x00\x01\x00\x01\x00\x00', 'time division of 0'),
+  (midi_file(track((0, b'\x90\x3c\x40')))[:-6], 'middle of an event'),
+  (midi_file(track((0, b'\x3c\x40'))), 'Running status'),
+])
+def test_bad_files_raise_clear_errors(tmp_path, data, message):
+  with pytest.raises(ValueError, match=message):
+    smf.read_instruments(write(tmp_path, data))
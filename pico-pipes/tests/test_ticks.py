@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from modules import fit, ticks, varint
+from modules.timeline import NOTE_DTYPE, NoteTimeline
+
+# Every unit a target writes times in, as check-ticks checks them
+UNITS = sorted({ticks.TICK_US, 1000, varint.TICK_US, *fit.TICK_STEPS_US})
+HOURS = 3600.0
+
+# Timeline of notes starting at the given times, each lasting length seconds
+def make_timeline(starts, length=0.25):
+  notes = np.zeros(len(starts), dtype=NOTE_DTYPE)
+  notes['track'] = np.arange(len(starts)) % 4
+  notes['pitch'] = 60
+  notes['on'] = starts
+  notes['off'] = notes['on'] + length
+  return NoteTimeline(notes, 'adversarial')
+
+# Times on exact halves of a tick and of a millisecond, early in a song and
+# ten hours in, where float seconds hold the fewest fractional digits
+def adversarial_timelines():
+  steps = np.arange(2000)
+  return {
+    'tick ties': make_timeline(steps * 10e-6 + 5e-6),
+    'ms ties': make_timeline(steps * 1e-3 + 0.5e-3),
+    'long song': make_timeline(np.linspace(0.0, 10 * HOURS, 2000)),
+    'long song ties': make_timeline(10 * HOURS - 1.0 + steps * 0.5e-3 + 5e-6, length=0.0005),
+  }
+
+@pytest.mark.parametrize('name', adversarial_timelines().keys())
+@pytest.mark.parametrize('unit_us', UNITS)
+def test_rounding_stays_bounded(name, unit_us):
+  timeline = adversarial_timelines()[name]
+  times = np.concatenate([timeline.on, timeline.off])
+  ticks.check(times, ticks.to_ticks(times), unit_us)
+
+# Rounding each unit from the previous note's instead of the absolute time
+# drifts on long songs, and the check has to catch it
+def test_drift_is_caught():
+  times = np.arange(1, 20001) * 1.0004e-3
+  base = ticks.to_ticks(times)
+  drifted = np.cumsum(np.diff(base, prepend=0) // 100) * 100
+  with pytest.raises(ValueError):
+    ticks.check(times, drifted, 1000)